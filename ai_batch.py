@@ -0,0 +1,177 @@
+"""
+Concurrent batch generation of AI depth maps and patterns.
+
+Prompts are read from a JSONL file (one ``{"prompt": ..., "type": ...}`` object
+per line, optionally with ``"id"`` and ``"seed"``) or a plain text file with one
+prompt per line. Requests run on an asyncio loop under a concurrency limit and
+a token-bucket rate limiter; the blocking ``StabilityClient`` calls run in
+worker threads. Each image is written to the output directory as soon as it
+completes, together with a line in ``results.jsonl``. Rerunning the same batch
+skips prompts whose image already exists, so an interrupted batch resumes
+where it stopped.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+import ai_cache
+import stability
+
+logger = logging.getLogger("StereogramSorcery")
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+RESULTS_FILE = "results.jsonl"
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, holding at most ``burst``.
+
+    ``defer(seconds)`` empties the bucket and holds it closed, which is how a
+    ``Retry-After`` from the API slows down every pending request, not just
+    the one that was told to wait.
+    """
+
+    def __init__(self, rate, burst):
+        if not 0 < rate < float("inf"):
+            raise ValueError(f"Rate must be a positive number of requests per second, not {rate}")
+        if burst < 1:
+            raise ValueError(f"Burst must be at least 1 request, not {burst}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def defer(self, seconds):
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = max(self.updated, self.blocked_until)
+
+
+def item_id(prompt, gen_type, seed=None):
+    key = json.dumps([prompt, gen_type, seed]).encode("utf-8")
+    return f"{gen_type}-{hashlib.sha256(key).hexdigest()[:12]}"
+
+
+def load_prompts(path, default_type="depthMap"):
+    """Read batch items as dicts with ``id``, ``prompt``, ``type`` and ``seed``."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+            else:
+                entry = {"prompt": line}
+            gen_type = entry.get("type", default_type)
+            if gen_type not in stability.GEN_TYPES:
+                raise ValueError(f"{path}:{line_no}: unknown type {gen_type!r}")
+            seed = entry.get("seed")
+            items.append({
+                "id": str(entry.get("id") or item_id(entry["prompt"], gen_type, seed)),
+                "prompt": entry["prompt"],
+                "type": gen_type,
+                "seed": seed,
+            })
+    return items
+
+
+def output_path(output_dir, item):
+    return os.path.join(output_dir, f"{item['id']}.png")
+
+
+async def _generate_one(item, client, cache, refresh, bucket, semaphore, output_dir, results, loop):
+    def on_retry(attempt, delay, reason):
+        # Called from the worker thread; hold back every other request too
+        loop.call_soon_threadsafe(bucket.defer, delay)
+
+    async with semaphore:
+        await bucket.acquire()
+        started = time.monotonic()
+        record = {"id": item["id"], "prompt": item["prompt"], "type": item["type"], "seed": item["seed"]}
+        try:
+            image, cached = await asyncio.to_thread(
+                ai_cache.generate, client, item["prompt"], item["type"], cache=cache, refresh=refresh,
+                seed=item["seed"], on_retry=on_retry)
+            path = output_path(output_dir, item)
+            await asyncio.to_thread(_save_atomic, image, path)
+            record.update(status="ok", path=path, cached=cached)
+        except Exception as e:
+            logger.error(f"Batch item {item['id']} failed: {e}")
+            record.update(status="error", error=str(e))
+        record["seconds"] = round(time.monotonic() - started, 3)
+        results.write(json.dumps(record) + "\n")
+        results.flush()
+        return record
+
+
+def _save_atomic(image, path):
+    tmp_path = f"{path}.tmp"
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
+async def run_batch(items, client, output_dir, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                    burst=DEFAULT_BURST, cache=None, refresh=False):
+    """Generate every item not already present in ``output_dir``; return the new result records."""
+    if concurrency < 1:
+        raise ValueError(f"Concurrency must be at least 1 request, not {concurrency}")
+    bucket = TokenBucket(rate, burst)
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [item for item in items if not os.path.exists(output_path(output_dir, item))]
+    skipped = len(items) - len(pending)
+    if skipped:
+        logger.info(f"Resuming batch: {skipped} of {len(items)} images already generated")
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    records = []
+    with open(os.path.join(output_dir, RESULTS_FILE), "a", encoding="utf-8") as results:
+        tasks = [asyncio.create_task(_generate_one(item, client, cache, refresh, bucket, semaphore,
+                                                   output_dir, results, loop))
+                 for item in pending]
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                record = await task
+                records.append(record)
+                logger.info(f"[{done}/{len(pending)}] {record['id']}: {record['status']}")
+        finally:
+            for task in tasks:
+                task.cancel()
+    return records
+
+
+def generate_batch(prompts_path, output_dir, api_key, host=stability.DEFAULT_HOST, engine=stability.DEFAULT_ENGINE,
+                   default_type="depthMap", concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                   burst=DEFAULT_BURST, use_cache=True, refresh=False):
+    items = load_prompts(prompts_path, default_type)
+    cache = ai_cache.ImageCache() if use_cache else None
+    # One pooled connection per concurrent request
+    with stability.StabilityClient(api_key, host=host, engine=engine, pool_size=concurrency) as client:
+        return asyncio.run(run_batch(items, client, output_dir, concurrency, rate, burst, cache, refresh))
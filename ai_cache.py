@@ -0,0 +1,147 @@
+"""
+On-disk cache for AI-generated depth maps and patterns.
+
+Images are stored as PNG under a content address: the SHA-256 of every
+request parameter that affects the result (enhanced prompt, generation type,
+engine, cfg scale, steps, size and seed). Reading an entry refreshes its
+modification time, and the least recently used entries are evicted once the
+cache grows past its byte budget.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from PIL import Image
+
+import instrument
+import stability
+
+logger = logging.getLogger("StereogramSorcery")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stereogram-sorcery", "ai")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(enhanced_prompt, gen_type, engine, cfg_scale, steps, width, height, seed):
+    params = {
+        "prompt": enhanced_prompt,
+        "gen_type": gen_type,
+        "engine": engine,
+        "cfg_scale": cfg_scale,
+        "steps": steps,
+        "width": width,
+        "height": height,
+        "seed": seed,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.png")
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            image = Image.open(path)
+            image.load()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        # mtime doubles as the last-used time for LRU eviction
+        os.utime(path)
+        return image
+
+    def put(self, key, image):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial PNG
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, format="PNG", optimize=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+        return path
+
+    def entries(self):
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".png"):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, stat.st_size, entry.path))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def generate(client, prompt, gen_type, cache=None, refresh=False, width=stability.DEFAULT_SIZE,
+             height=stability.DEFAULT_SIZE, cfg_scale=stability.DEFAULT_CFG_SCALE,
+             steps=stability.DEFAULT_STEPS, seed=None, on_retry=None):
+    """Return ``(image, from_cache)`` for a depth map or pattern prompt.
+
+    Depth maps come back in mode "L" and patterns in "RGB". With ``cache``
+    set, a stored result is returned without touching the network unless
+    ``refresh`` is true, in which case a new image is generated and replaces it.
+    """
+    enhanced_prompt = stability.enhance_prompt(prompt, gen_type)
+    key = cache_key(enhanced_prompt, gen_type, client.engine, cfg_scale, steps, width, height, seed)
+    with instrument.stage("ai_request", gen_type=gen_type, key=key[:12]) as record:
+        if cache is not None and not refresh:
+            image = cache.get(key)
+            if image is not None:
+                logger.info(f"AI cache hit for {gen_type} prompt {prompt[:40]!r}")
+                record["cached"] = True
+                return image, True
+        record["retries"] = 0
+
+        def count_retry(attempt, delay, reason):
+            record["retries"] = attempt
+            if on_retry is not None:
+                on_retry(attempt, delay, reason)
+
+        image = client.text_to_image(enhanced_prompt, width=width, height=height, cfg_scale=cfg_scale,
+                                     steps=steps, seed=seed, on_retry=count_retry)
+        image = image.convert("L" if gen_type == "depthMap" else "RGB")
+        if cache is not None:
+            cache.put(key, image)
+        return image, False
@@ -6,23 +6,47 @@ Unleash the magic of 3D illusions and hidden messages with this enchanting Pytho
 Craft your own stereogram spells using mystical depth maps, enchanted patterns, and secret incantations.
 """
 
+import time
+
+# Startup is measured from here, before tkinter loads
+STARTED = time.perf_counter()
+
 import os
+import sys
 import threading
+import tracemalloc
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-from PIL import Image, ImageTk
-import numpy as np
-import requests
-import base64
-from io import BytesIO
 import logging
 
+import instrument
+from jobs import JobScheduler
+
+# NumPy, Pillow, the render modules and the Stability client are imported where
+# they are first used, so the window is up before any of them load
+HEAVY_MODULES = ("numpy", "PIL.Image", "PIL.ImageTk", "engine", "backends", "pipeline", "requests", "stability")
+
 # Set up cosmic logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(levelname)s - %(message)s',
                     handlers=[logging.StreamHandler()])
 logger = logging.getLogger("StereogramSorcery")
 
+# Live preview: at most one low-resolution frame per PREVIEW_DELAY_MS while a slider
+# moves, then a full-resolution render once it has been still for REFINE_DELAY_MS
+PREVIEW_DELAY_MS = 30
+# Preview frames render on the Tk thread, so they use a backend with no JIT compile
+# to stall it. From an 8K depth map on a 900x650 canvas a frame takes about 30 ms
+# in classic mode and 50 ms in linked mode on one core.
+PREVIEW_BACKEND = "numpy"
+REFINE_DELAY_MS = 600
+# Canvas redraws wait for the window to stop resizing; zoom and drag redraw almost at once
+REDRAW_DELAY_MS = 50
+INTERACTION_DELAY_MS = 10
+ZOOM_STEP = 1.25
+# Loaded depth maps are shown from a copy no larger than this; renders read the full map
+DISPLAY_BOUNDS = (2048, 2048)
+
 class StereogramSorcery:
     def __init__(self, root):
         try:
@@ -37,14 +61,32 @@ class StereogramSorcery:
             self.default_api_key = "ENTER-KEY-HEYE"
             self.api_host = "https://api.stability.ai"
             self.api_engine = "stable-diffusion-v1-6"
+            self.ai_client = None
+            self.ai_client_lock = threading.Lock()
+            self.ai_cache = None
             
             # Image and array holders for magical ingredients
             self.depth_img = None
             self.pattern_img = None
-            self.depth_array = None
-            self.pattern_array = None
+            self.depth_source = None
             self.result_img = None
-            self.is_generating = False
+            self.result_message = None
+            self.exports = None
+            self.parallel_renderer = None
+            self.parallel_renderer_lock = threading.Lock()
+            self.jobs = JobScheduler(dispatch=lambda callback: self.root.after(0, callback))
+            self.render_graph = None
+            self.render_graph_lock = threading.Lock()
+            self.preview_depth = None
+            self.preview_after_id = None
+            self.refine_after_id = None
+            # Per preview canvas: (pyramid of the image shown, its zoom and pan)
+            self.canvas_views = {}
+            self.redraw_after_ids = {}
+            self.drag_origin = None
+            # Rarely used panels are built the first time they are shown
+            self.ai_tab_built = False
+            self.advanced_frame = None
             
             # Set up enchanted styles and layout
             self.setup_styles()
@@ -136,7 +178,7 @@ class StereogramSorcery:
             self.input_notebook.add(self.ai_tab, text="AI Enchantment")
             
             self.setup_manual_tab()
-            self.setup_ai_tab()
+            self.input_notebook.bind("<<NotebookTabChanged>>", self.on_input_tab_changed)
             
             # Stereogram Spell Settings
             self.add_section_header("Stereogram Spell Settings")
@@ -161,6 +203,20 @@ class StereogramSorcery:
             depth_scale = ttk.Scale(self.controls_content, from_=.01, to=.05, orient=tk.HORIZONTAL,
                                     variable=self.depth_contrast_var, command=self.update_depth_contrast_label)
             depth_scale.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+            self.live_preview_var = tk.BooleanVar(value=True)
+            live_preview = ttk.Checkbutton(self.controls_content, text="Live Preview", variable=self.live_preview_var, style="TCheckbutton")
+            live_preview.pack(padx=10, pady=(0, 10), anchor=tk.W)
+
+            # Workers, render mode, backend, memory budget and profiling live in a panel built on first use.
+            # Empty backend and mode mean the defaults, resolved when rendering; a zero budget means none
+            self.workers_var = tk.IntVar(value=1)
+            self.memory_budget_var = tk.IntVar(value=0)
+            self.mode_var = tk.StringVar(value="")
+            self.backend_var = tk.StringVar(value="")
+            self.profile_var = tk.BooleanVar(value=False)
+            self.advanced_btn = ttk.Button(self.controls_content, text="Advanced Sorcery ▸", command=self.toggle_advanced)
+            self.advanced_btn.pack(fill=tk.X, padx=10, pady=(0, 10))
             
             # Hidden Spell (Secret Message)
             self.add_section_header("Secret Spell")
@@ -173,14 +229,28 @@ class StereogramSorcery:
             
             # Output Settings
             self.add_section_header("Final Spell Output")
-            ttk.Label(self.controls_content, text="Output Format", style="TLabel").pack(fill=tk.X, padx=10, pady=(10, 0))
-            self.format_var = tk.StringVar(value="png")
-            format_frame = ttk.Frame(self.controls_content)
-            format_frame.pack(fill=tk.X, padx=10, pady=(5, 5))
-            ttk.Radiobutton(format_frame, text="PNG", variable=self.format_var, value="png", style="TRadiobutton").pack(side=tk.LEFT, padx=(0, 10))
-            ttk.Radiobutton(format_frame, text="JPEG", variable=self.format_var, value="jpeg", style="TRadiobutton").pack(side=tk.LEFT)
-            # Bind change of format to toggle JPEG quality settings
-            self.format_var.trace_add("write", lambda *args: self.toggle_jpeg_quality())
+            # Every ticked format is written in one background save, each reporting its size and encode time
+            ttk.Label(self.controls_content, text="Output Formats", style="TLabel").pack(fill=tk.X, padx=10, pady=(10, 0))
+            self.png_var = tk.BooleanVar(value=True)
+            self.jpeg_var = tk.BooleanVar(value=False)
+            self.webp_var = tk.BooleanVar(value=False)
+            self.format_frame = ttk.Frame(self.controls_content)
+            self.format_frame.pack(fill=tk.X, padx=10, pady=(5, 5))
+            ttk.Checkbutton(self.format_frame, text="PNG", variable=self.png_var, style="TCheckbutton").pack(side=tk.LEFT, padx=(0, 10))
+            ttk.Checkbutton(self.format_frame, text="JPEG", variable=self.jpeg_var, style="TCheckbutton").pack(side=tk.LEFT, padx=(0, 10))
+            ttk.Checkbutton(self.format_frame, text="WebP (lossless)", variable=self.webp_var, style="TCheckbutton").pack(side=tk.LEFT)
+            # Bind format changes to show each format's settings
+            for var in (self.png_var, self.jpeg_var):
+                var.trace_add("write", lambda *args: self.toggle_format_settings())
+
+            self.png_level_frame = ttk.Frame(self.controls_content)
+            self.png_level_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+            self.png_level_var = tk.IntVar(value=6)
+            self.png_level_label = ttk.Label(self.png_level_frame, text=f"PNG Compression: {self.png_level_var.get()}", style="TLabel")
+            self.png_level_label.pack(fill=tk.X)
+            png_scale = ttk.Scale(self.png_level_frame, from_=0, to=9, orient=tk.HORIZONTAL,
+                                  variable=self.png_level_var, command=self.update_png_level_label)
+            png_scale.pack(fill=tk.X)
             
             self.jpeg_quality_frame = ttk.Frame(self.controls_content)
             self.jpeg_quality_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
@@ -190,7 +260,7 @@ class StereogramSorcery:
             jpeg_scale = ttk.Scale(self.jpeg_quality_frame, from_=0.3, to=1.0, orient=tk.HORIZONTAL,
                                    variable=self.jpeg_quality_var, command=self.update_jpeg_quality_label)
             jpeg_scale.pack(fill=tk.X)
-            if self.format_var.get() != "jpeg":
+            if not self.jpeg_var.get():
                 self.jpeg_quality_frame.pack_forget()
             
             # Mystic API Portal
@@ -220,6 +290,64 @@ class StereogramSorcery:
             logger.error(f"Error setting up controls: {e}")
             raise
 
+    def toggle_advanced(self):
+        try:
+            if self.advanced_frame is None:
+                self.setup_advanced()
+            elif self.advanced_frame.winfo_manager():
+                self.advanced_frame.pack_forget()
+                self.advanced_btn.config(text="Advanced Sorcery ▸")
+                return
+            self.advanced_frame.pack(fill=tk.X, after=self.advanced_btn)
+            self.advanced_btn.config(text="Advanced Sorcery ▾")
+        except Exception as e:
+            logger.error(f"Error toggling advanced settings: {e}")
+
+    def setup_advanced(self):
+        import backends
+        if not self.mode_var.get():
+            self.mode_var.set(backends.DEFAULT_MODE)
+        if not self.backend_var.get():
+            self.backend_var.set(backends.preferred())
+        self.advanced_frame = ttk.Frame(self.controls_content)
+        # Row bands are rendered on this many processes; 1 keeps rendering in-process
+        ttk.Label(self.advanced_frame, text="Render Workers", style="TLabel").pack(fill=tk.X, padx=10, pady=(10, 0))
+        workers_spin = ttk.Spinbox(self.advanced_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.workers_var, width=5)
+        workers_spin.pack(padx=10, pady=(0, 10), anchor=tk.W)
+
+        # "linked" adds symmetric constraint links and hidden-surface removal (see sirds.py)
+        ttk.Label(self.advanced_frame, text="Render Mode", style="TLabel").pack(fill=tk.X, padx=10, pady=(10, 0))
+        mode_combo = ttk.Combobox(self.advanced_frame, textvariable=self.mode_var, values=backends.MODES, state="readonly", width=12)
+        mode_combo.pack(padx=10, pady=(0, 10), anchor=tk.W)
+        mode_combo.bind("<<ComboboxSelected>>", lambda event: self.schedule_preview())
+
+        # Every backend of a mode draws the same pixels; they only differ in speed on this machine
+        ttk.Label(self.advanced_frame, text="Render Engine", style="TLabel").pack(fill=tk.X, padx=10, pady=(10, 0))
+        backend_combo = ttk.Combobox(self.advanced_frame, textvariable=self.backend_var, values=backends.names(), state="readonly", width=12)
+        backend_combo.pack(padx=10, pady=(0, 10), anchor=tk.W)
+
+        # Renders in row bands small enough to keep a render's peak memory under this; 0 means no limit
+        ttk.Label(self.advanced_frame, text="Memory Budget (MB)", style="TLabel").pack(fill=tk.X, padx=10, pady=(10, 0))
+        budget_spin = ttk.Spinbox(self.advanced_frame, from_=0, to=65536, increment=64, textvariable=self.memory_budget_var, width=7)
+        budget_spin.pack(padx=10, pady=(0, 10), anchor=tk.W)
+
+        # Writes a cProfile dump of the next full render to the temp directory
+        profile_check = ttk.Checkbutton(self.advanced_frame, text="Profile Next Spell", variable=self.profile_var, style="TCheckbutton")
+        profile_check.pack(padx=10, pady=(0, 10), anchor=tk.W)
+
+    def render_choice(self):
+        """Backend and mode from the advanced settings, or the defaults if they were never opened."""
+        import backends
+        return self.backend_var.get() or backends.preferred(), self.mode_var.get() or backends.DEFAULT_MODE
+
+    def on_input_tab_changed(self, event):
+        try:
+            if not self.ai_tab_built and self.input_notebook.select() == str(self.ai_tab):
+                self.setup_ai_tab()
+                self.ai_tab_built = True
+        except Exception as e:
+            logger.error(f"Error opening AI tab: {e}")
+
     def setup_manual_tab(self):
         try:
             ttk.Label(self.manual_tab, text="Mystic Depth Map", style="TLabel").pack(fill=tk.X, pady=(10, 5))
@@ -263,6 +391,9 @@ class StereogramSorcery:
             gen_frame.pack(fill=tk.X, pady=(0, 10))
             ttk.Radiobutton(gen_frame, text="Depth Map", variable=self.gen_type_var, value="depthMap", style="TRadiobutton").pack(side=tk.LEFT, padx=(0, 10))
             ttk.Radiobutton(gen_frame, text="Pattern", variable=self.gen_type_var, value="pattern", style="TRadiobutton").pack(side=tk.LEFT)
+            self.ai_refresh_var = tk.BooleanVar(value=False)
+            ttk.Checkbutton(self.ai_tab, text="Conjure Anew (ignore cached result)", variable=self.ai_refresh_var,
+                            style="TCheckbutton").pack(anchor=tk.W, pady=(0, 5))
             self.ai_gen_btn = ttk.Button(self.ai_tab, text="ENCHANT WITH AI", style="Primary.TButton",
                                          command=self.generate_with_ai)
             self.ai_gen_btn.pack(fill=tk.X, pady=(10, 5))
@@ -272,6 +403,9 @@ class StereogramSorcery:
 
     def setup_preview(self):
         try:
+            # Status line with per-stage timings of the last render, AI request or save
+            self.metrics_label = ttk.Label(self.preview_frame, text="", style="TLabel", font=("Segoe UI", 8))
+            self.metrics_label.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
             self.preview_notebook = ttk.Notebook(self.preview_frame)
             self.preview_notebook.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
             self.result_tab = ttk.Frame(self.preview_notebook)
@@ -289,11 +423,22 @@ class StereogramSorcery:
             self.result_canvas.create_text(200, 200, text="No enchantment cast yet", fill=self.text_color, font=("Segoe UI", 12), tags="placeholder_text")
             self.depth_canvas.create_text(200, 200, text="No depth map revealed", fill=self.text_color, font=("Segoe UI", 12), tags="placeholder_text")
             self.pattern_canvas.create_text(200, 200, text="No pattern discovered", fill=self.text_color, font=("Segoe UI", 12), tags="placeholder_text")
+            for canvas in (self.result_canvas, self.depth_canvas, self.pattern_canvas):
+                canvas.bind("<Configure>", lambda event, canvas=canvas: self.schedule_redraw(canvas))
+            # Wheel zooms around the pointer, drag pans, double-click toggles fit and 1:1
+            self.result_canvas.bind("<MouseWheel>", lambda event: self.zoom_result(event, ZOOM_STEP if event.delta > 0 else 1 / ZOOM_STEP))
+            self.result_canvas.bind("<Button-4>", lambda event: self.zoom_result(event, ZOOM_STEP))
+            self.result_canvas.bind("<Button-5>", lambda event: self.zoom_result(event, 1 / ZOOM_STEP))
+            self.result_canvas.bind("<ButtonPress-1>", self.start_result_drag)
+            self.result_canvas.bind("<B1-Motion>", self.drag_result)
+            self.result_canvas.bind("<Double-Button-1>", self.toggle_result_zoom)
             self.loading_frame = ttk.Frame(self.preview_frame)
             self.loading_label = ttk.Label(self.loading_frame, text="Conjuring...", style="TLabel")
             self.loading_label.pack(pady=20)
             self.progress = ttk.Progressbar(self.loading_frame, orient=tk.HORIZONTAL, length=200, mode='indeterminate')
             self.progress.pack(pady=10)
+            self.cancel_btn = ttk.Button(self.loading_frame, text="Cancel", command=self.cancel_jobs)
+            self.cancel_btn.pack(pady=(0, 10))
             self.loading_frame.place_forget()
         except Exception as e:
             logger.error(f"Error setting up preview: {e}")
@@ -314,6 +459,7 @@ class StereogramSorcery:
         try:
             value = int(float(value))
             self.shift_strength_label.config(text=f"Shift Strength: {value}")
+            self.schedule_preview()
         except Exception as e:
             logger.error(f"Error updating shift label: {e}")
 
@@ -321,6 +467,7 @@ class StereogramSorcery:
         try:
             value = float(value)
             self.pattern_scale_label.config(text=f"Pattern Scale: {value:.1f}")
+            self.schedule_preview()
         except Exception as e:
             logger.error(f"Error updating pattern scale label: {e}")
 
@@ -328,9 +475,52 @@ class StereogramSorcery:
         try:
             value = float(value)
             self.depth_contrast_label.config(text=f"Depth Contrast: {value:.2f}")
+            self.schedule_preview()
         except Exception as e:
             logger.error(f"Error updating depth contrast label: {e}")
 
+    def schedule_preview(self):
+        try:
+            if not self.live_preview_var.get() or not self.depth_img or not self.pattern_img:
+                return
+            if self.preview_after_id is None:
+                self.preview_after_id = self.root.after(PREVIEW_DELAY_MS, self.render_live_preview)
+            if self.refine_after_id is not None:
+                self.root.after_cancel(self.refine_after_id)
+            self.refine_after_id = self.root.after(REFINE_DELAY_MS, self.refine_preview)
+        except Exception as e:
+            logger.error(f"Error scheduling preview: {e}")
+
+    def render_live_preview(self):
+        self.preview_after_id = None
+        try:
+            import engine
+            canvas_width = self.result_canvas.winfo_width()
+            canvas_height = self.result_canvas.winfo_height()
+            if canvas_width <= 1 or canvas_height <= 1 or self.depth_source is None:
+                return
+            width = self.depth_source.size[0]
+            size = engine.preview_size(self.depth_source.size, (canvas_width, canvas_height))
+            # Downscaling an 8K depth map is the slow part, so keep one proxy per canvas size
+            if self.preview_depth is None or self.preview_depth[0] is not self.depth_source or self.preview_depth[1] != size:
+                self.preview_depth = (self.depth_source, size, self.depth_source.preview(size))
+            preview = engine.render_preview(self.preview_depth[2], self.pattern_img,
+                                            self.shift_strength_var.get(), self.pattern_scale_var.get(),
+                                            self.depth_contrast_var.get(), size[0] / width, PREVIEW_BACKEND,
+                                            self.render_choice()[1])
+            self.update_canvas_image(self.result_canvas, preview)
+            self.preview_notebook.select(0)
+        except Exception as e:
+            logger.error(f"Error rendering live preview: {e}")
+
+    def refine_preview(self):
+        self.refine_after_id = None
+        try:
+            # Supersedes any full render still running for older slider values
+            self.generate_stereogram()
+        except Exception as e:
+            logger.error(f"Error refining preview: {e}")
+
     def update_jpeg_quality_label(self, value):
         try:
             value = float(value)
@@ -338,26 +528,55 @@ class StereogramSorcery:
         except Exception as e:
             logger.error(f"Error updating JPEG quality label: {e}")
 
-    def toggle_jpeg_quality(self):
+    def update_png_level_label(self, value):
         try:
-            if self.format_var.get() == "jpeg":
-                self.jpeg_quality_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
-            else:
-                self.jpeg_quality_frame.pack_forget()
+            value = int(float(value))
+            self.png_level_label.config(text=f"PNG Compression: {value}")
         except Exception as e:
-            logger.error(f"Error toggling JPEG quality: {e}")
+            logger.error(f"Error updating PNG compression label: {e}")
+
+    def toggle_format_settings(self):
+        try:
+            self.png_level_frame.pack_forget()
+            self.jpeg_quality_frame.pack_forget()
+            # Packing each right after the checkboxes, JPEG first, keeps PNG's settings on top
+            if self.jpeg_var.get():
+                self.jpeg_quality_frame.pack(fill=tk.X, padx=10, pady=(0, 10), after=self.format_frame)
+            if self.png_var.get():
+                self.png_level_frame.pack(fill=tk.X, padx=10, pady=(0, 10), after=self.format_frame)
+        except Exception as e:
+            logger.error(f"Error toggling format settings: {e}")
 
     def load_depth_map(self):
         try:
+            import loader
             file_path = filedialog.askopenfilename(
                 title="Select Mystic Depth Map",
-                filetypes=[("Image files", "*.png *.jpg *.jpeg *.bmp *.gif")]
+                filetypes=[("Image files", " ".join(loader.DEPTH_FILETYPES))]
             )
             if not file_path:
                 return
-            self.depth_img = Image.open(file_path)
-            self.depth_array = np.array(self.depth_img.convert("L"))
-            self.depth_label.config(text=os.path.basename(file_path))
+            self.depth_label.config(text=f"Unveiling {os.path.basename(file_path)}...")
+            self.jobs.submit("load_depth", self._load_depth_job, file_path,
+                             on_done=self.on_depth_loaded, on_error=self.on_load_error)
+        except Exception as e:
+            logger.error(f"Error loading depth map: {e}")
+            messagebox.showerror("Error", f"Failed to load depth map: {e}")
+
+    def _load_depth_job(self, job, file_path):
+        # JPEGs and mapped arrays are shown from a reduced copy; other formats are decoded in full
+        # here, off the UI thread, and kept for the render
+        import loader
+        # Setting the same value again is harmless, so concurrent load jobs need no lock
+        loader.allow_large_images()
+        source = loader.DepthSource(file_path)
+        job.check()
+        return source, source.thumbnail(DISPLAY_BOUNDS)
+
+    def on_depth_loaded(self, job, result):
+        try:
+            self.depth_source, self.depth_img = result
+            self.depth_label.config(text=self.depth_source.name)
             self.update_depth_preview()
             if self.pattern_img:
                 self.show_notification("Both magical ingredients ready for the spell!")
@@ -365,7 +584,6 @@ class StereogramSorcery:
             self.show_notification("Mystic depth map loaded!")
         except Exception as e:
             logger.error(f"Error loading depth map: {e}")
-            messagebox.showerror("Error", f"Failed to load depth map: {e}")
 
     def load_pattern(self):
         try:
@@ -375,8 +593,21 @@ class StereogramSorcery:
             )
             if not file_path:
                 return
-            self.pattern_img = Image.open(file_path)
-            self.pattern_array = np.array(self.pattern_img.convert("RGB"))
+            self.pattern_label.config(text=f"Unveiling {os.path.basename(file_path)}...")
+            self.jobs.submit("load_pattern", self._load_pattern_job, file_path,
+                             on_done=self.on_pattern_loaded, on_error=self.on_load_error)
+        except Exception as e:
+            logger.error(f"Error loading pattern image: {e}")
+            messagebox.showerror("Error", f"Failed to load pattern image: {e}")
+
+    def _load_pattern_job(self, job, file_path):
+        # Every preview tiles the pattern, so it is decoded in full, just not on the UI thread
+        import engine
+        return file_path, engine.load_pattern(file_path)
+
+    def on_pattern_loaded(self, job, result):
+        try:
+            file_path, self.pattern_img = result
             self.pattern_label.config(text=os.path.basename(file_path))
             self.update_pattern_preview()
             if self.depth_img:
@@ -385,70 +616,113 @@ class StereogramSorcery:
             self.show_notification("Enchanted pattern loaded!")
         except Exception as e:
             logger.error(f"Error loading pattern image: {e}")
-            messagebox.showerror("Error", f"Failed to load pattern image: {e}")
+
+    def on_load_error(self, job, error):
+        label = self.depth_label if job.kind == "load_depth" else self.pattern_label
+        label.config(text="No file selected")
+        messagebox.showerror("Error", f"Failed to load image: {error}")
 
     def update_depth_preview(self):
         try:
+            from PIL import ImageTk
             if not self.depth_img:
                 return
-            thumbnail = self.resize_image_to_fit(self.depth_img, self.depth_preview_frame.winfo_width(), 100)
-            photo = ImageTk.PhotoImage(thumbnail)
+            pyramid = self.update_canvas_image(self.depth_canvas, self.depth_img)
+            photo = ImageTk.PhotoImage(pyramid.fit(self.depth_preview_frame.winfo_width(), 100))
             self.depth_preview_label.config(image=photo, text="")
             self.depth_preview_label.image = photo
-            self.update_canvas_image(self.depth_canvas, self.depth_img)
         except Exception as e:
             logger.error(f"Error updating depth preview: {e}")
 
     def update_pattern_preview(self):
         try:
+            from PIL import ImageTk
             if not self.pattern_img:
                 return
-            thumbnail = self.resize_image_to_fit(self.pattern_img, self.pattern_preview_frame.winfo_width(), 100)
-            photo = ImageTk.PhotoImage(thumbnail)
+            pyramid = self.update_canvas_image(self.pattern_canvas, self.pattern_img)
+            photo = ImageTk.PhotoImage(pyramid.fit(self.pattern_preview_frame.winfo_width(), 100))
             self.pattern_preview_label.config(image=photo, text="")
             self.pattern_preview_label.image = photo
-            self.update_canvas_image(self.pattern_canvas, self.pattern_img)
         except Exception as e:
             logger.error(f"Error updating pattern preview: {e}")
 
     def update_canvas_image(self, canvas, img):
+        """Show ``img`` on ``canvas`` and return its pyramid.
+
+        The pyramid is built once per image, and the canvas is drawn when it is
+        mapped and again after each resize, so no full-size resize runs here.
+        """
+        from viewport import ImagePyramid, Viewport
+        pyramid, view = self.canvas_views.get(canvas, (None, None))
+        if pyramid is None or pyramid.source is not img:
+            pyramid = ImagePyramid(img)
+            view = view or Viewport()
+            view.set_image(img.size)
+            self.canvas_views[canvas] = (pyramid, view)
+        self.redraw_canvas(canvas)
+        return pyramid
+
+    def schedule_redraw(self, canvas, delay=REDRAW_DELAY_MS):
+        after_id = self.redraw_after_ids.pop(canvas, None)
+        if after_id is not None:
+            self.root.after_cancel(after_id)
+        self.redraw_after_ids[canvas] = self.root.after(delay, lambda: self.redraw_canvas(canvas))
+
+    def redraw_canvas(self, canvas):
+        after_id = self.redraw_after_ids.pop(canvas, None)
+        if after_id is not None:
+            self.root.after_cancel(after_id)
+        if canvas not in self.canvas_views:
+            return
         try:
-            canvas.delete("all")
+            from PIL import ImageTk
             canvas_width = canvas.winfo_width()
             canvas_height = canvas.winfo_height()
             if canvas_width <= 1 or canvas_height <= 1:
-                canvas.create_text(200, 200, text="Loading...", fill=self.text_color)
-                self.root.after(100, lambda: self.update_canvas_image(canvas, img))
+                # Not mapped yet; its first <Configure> draws it
                 return
-            resized = self.resize_image_to_fit(img, canvas_width, canvas_height)
-            photo = ImageTk.PhotoImage(resized)
+            pyramid, view = self.canvas_views[canvas]
+            view.set_canvas((canvas_width, canvas_height))
+            tile, (x, y) = view.render(pyramid)
+            photo = ImageTk.PhotoImage(tile)
+            canvas.delete("all")
             setattr(canvas, 'image', photo)
-            img_width, img_height = resized.size
-            x = (canvas_width - img_width) // 2
-            y = (canvas_height - img_height) // 2
             canvas.create_image(x, y, anchor=tk.NW, image=photo)
+            if view.zoom is not None:
+                canvas.create_text(canvas_width - 8, canvas_height - 8, anchor=tk.SE, text=f"{view.zoom:.0%}",
+                                   fill=self.text_color, font=("Segoe UI", 9))
         except Exception as e:
             logger.error(f"Error updating canvas image: {e}")
+            canvas.delete("all")
             center_x = max(canvas.winfo_width(), 200) // 2
             center_y = max(canvas.winfo_height(), 200) // 2
             canvas.create_text(center_x, center_y, text="Error displaying image", fill="#D32F2F")
 
-    def resize_image_to_fit(self, img, width, height):
-        if not img:
-            return None
-        try:
-            if width <= 0 or height <= 0:
-                return img
-            img_width, img_height = img.size
-            scale = min(width / max(img_width, 1), height / max(img_height, 1))
-            if scale < 1:
-                new_width = max(int(img_width * scale), 1)
-                new_height = max(int(img_height * scale), 1)
-                return img.resize((new_width, new_height), Image.LANCZOS)
-            return img
-        except Exception as e:
-            logger.error(f"Error resizing image: {e}")
-            return img
+    def zoom_result(self, event, factor):
+        if self.result_canvas not in self.canvas_views:
+            return
+        self.canvas_views[self.result_canvas][1].zoom_at(factor, event.x, event.y)
+        self.schedule_redraw(self.result_canvas, INTERACTION_DELAY_MS)
+
+    def start_result_drag(self, event):
+        self.drag_origin = (event.x, event.y)
+
+    def drag_result(self, event):
+        if self.result_canvas not in self.canvas_views or self.drag_origin is None:
+            return
+        self.canvas_views[self.result_canvas][1].pan(event.x - self.drag_origin[0], event.y - self.drag_origin[1])
+        self.drag_origin = (event.x, event.y)
+        self.schedule_redraw(self.result_canvas, INTERACTION_DELAY_MS)
+
+    def toggle_result_zoom(self, event):
+        if self.result_canvas not in self.canvas_views:
+            return
+        view = self.canvas_views[self.result_canvas][1]
+        if view.zoom is None:
+            view.actual_size(event.x, event.y)
+        else:
+            view.reset()
+        self.redraw_canvas(self.result_canvas)
 
     def show_notification(self, message, is_error=False):
         try:
@@ -463,72 +737,144 @@ class StereogramSorcery:
             if not self.depth_img or not self.pattern_img:
                 self.show_notification("Both depth map and pattern are required", True)
                 return
-            if self.is_generating:
-                return
-            self.is_generating = True
-            self.loading_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-            self.loading_label.configure(text="Casting stereogram spell...")
-            self.progress.start(10)
-            thread = threading.Thread(target=self._generate_stereogram_thread)
-            thread.daemon = True
-            thread.start()
+            from pipeline import RenderParams
+            # Snapshot every setting now so the job never touches Tk variables off the main thread
+            message = self.hidden_message.get("1.0", tk.END).strip() if self.enable_stego_var.get() else ""
+            backend, mode = self.render_choice()
+            params = RenderParams(
+                depth_source=self.depth_source,
+                pattern_img=self.pattern_img,
+                shift_strength=self.shift_strength_var.get(),
+                pattern_scale=self.pattern_scale_var.get(),
+                contrast=self.depth_contrast_var.get(),
+                message=message,
+                workers=self.workers_var.get(),
+                backend=backend,
+                mode=mode,
+                memory_budget=self.memory_budget_var.get() * 2 ** 20 or None,
+            )
+            profile_path = None
+            if self.profile_var.get():
+                import tempfile
+                profile_path = os.path.join(tempfile.gettempdir(), f"sorcery-render-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+                self.profile_var.set(False)
+            self.show_loading("Casting stereogram spell...", determinate=True)
+            self.jobs.submit("render", self._render_job, params, profile_path,
+                             on_done=self.on_render_done, on_error=self.on_job_error,
+                             on_progress=self.on_job_progress, on_finish=self.on_job_finish)
         except Exception as e:
             logger.error(f"Error initiating stereogram generation: {e}")
-            self.is_generating = False
-
-    def _generate_stereogram_thread(self):
-        try:
-            shift_strength = self.shift_strength_var.get()
-            pattern_scale = self.pattern_scale_var.get()
-            contrast = self.depth_contrast_var.get()
-            # Apply our gentler contrast adjustment
-            depth_enhanced = self.adjust_contrast(self.depth_array, contrast)
-            pattern_width = int(self.pattern_img.width * pattern_scale)
-            pattern_height = int(self.pattern_img.height * pattern_scale)
-            pattern_scaled = self.pattern_img.resize((pattern_width, pattern_height), Image.LANCZOS)
-            pattern_tiled = Image.new("RGB", self.depth_img.size)
-            for y in range(0, self.depth_img.height, pattern_height):
-                for x in range(0, self.depth_img.width, pattern_width):
-                    pattern_tiled.paste(pattern_scaled, (x, y))
-            pattern_array = np.array(pattern_tiled)
-            width, height = self.depth_img.size
-            result_array = np.zeros((height, width, 3), dtype=np.uint8)
-            for y in range(height):
-                row = np.zeros((width, 3), dtype=np.uint8)
-                row[:shift_strength] = pattern_array[y, :shift_strength]
-                for x in range(shift_strength, width):
-                    depth_val = depth_enhanced[y, x] / 255.0
-                    shift = int(depth_val * shift_strength)
-                    if x - shift < shift_strength:
-                        row[x] = pattern_array[y, x]
-                    else:
-                        row[x] = row[x - shift]
-                result_array[y] = row
-            self.result_img = Image.fromarray(result_array.astype(np.uint8))
-            if self.enable_stego_var.get():
-                message = self.hidden_message.get("1.0", tk.END).strip()
-                if message:
-                    self.result_img = self.embed_message(self.result_img, message)
-            self.root.after(0, self.update_result_preview)
-        except Exception as e:
-            self.root.after(0, lambda: self.show_notification(f"Error: {e}", True))
-            logger.error(f"Error generating stereogram: {e}")
-        finally:
-            self.root.after(0, self.hide_loading)
-            self.is_generating = False
-
-    def adjust_contrast(self, image_array, contrast_factor):
-        try:
-            f = image_array.astype(np.float32)
-            # Use a gentler contrast adjustment by blending the original value with the full contrast effect.
-            # This prevents extreme clamping that can black out the image.
-            multiplier = 0.5 * contrast_factor + 0.5  # When contrast_factor is 1.0, multiplier is 1.0
-            adjusted = (f - 128) * multiplier + 128
-            adjusted = np.clip(adjusted, 0, 255)
-            return adjusted.astype(np.uint8)
-        except Exception as e:
-            logger.error(f"Error adjusting contrast: {e}")
-            return image_array
+
+    def _render_job(self, job, params, profile_path=None):
+        with instrument.collect() as records:
+            if profile_path:
+                with instrument.profiled(profile_path):
+                    rendered = self._render(job, params)
+            else:
+                rendered = self._render(job, params)
+        return rendered, instrument.summary(records), profile_path
+
+    def _render(self, job, params):
+        import backends
+        import engine
+        from PIL import Image
+        depth_array = params.depth_source.array
+        band_rows = None
+        if params.memory_budget:
+            height, width = depth_array.shape[:2]
+            band_rows = backends.band_rows(params.memory_budget, (width, height), params.backend, params.mode,
+                                           params.workers)
+        # Progress reports double as cancellation checks between row chunks
+        if params.workers > 1:
+            parallel_renderer = self.get_parallel_renderer(params.workers)
+            renderer = lambda depth, pattern, shift: parallel_renderer.render(
+                depth, pattern, shift, progress=job.report, backend=params.backend, mode=params.mode,
+                band_rows=band_rows)
+        else:
+            kernel = backends.get(params.backend, params.mode)
+            chunk_rows = min(band_rows or engine.DEFAULT_CHUNK_ROWS, engine.DEFAULT_CHUNK_ROWS)
+            renderer = lambda depth, pattern, shift: engine.render_rows(
+                depth, pattern, shift, progress=job.report, chunk_rows=chunk_rows, render=kernel)
+        # Stages whose inputs are unchanged since the last render come from the graph's cache
+        job.check()
+        render_graph = self.get_render_graph()
+        render = lambda message: render_graph.render(
+            depth_array, params.pattern_img, params.shift_strength, params.pattern_scale,
+            params.contrast, message=message, renderer=renderer, mode=params.mode)
+        embedded = params.message or None
+        try:
+            result_array = render(params.message)
+        except ValueError as e:
+            if not params.message:
+                raise
+            # Keep the stereogram without the message; the upstream stages are cached
+            logger.error(f"Error embedding message: {e}")
+            embedded = None
+            result_array = render(None)
+        job.check()
+        logger.info(f"Render cache: {render_graph.stats()}")
+        # The message travels with the image so exports can check it survived
+        return Image.fromarray(result_array), embedded
+
+    def on_render_done(self, job, result):
+        (self.result_img, self.result_message), metrics, profile_path = result
+        self.set_metrics(f"Render: {metrics}")
+        self.update_result_preview()
+        if profile_path:
+            self.show_notification(f"Profile written to {profile_path}")
+
+    def set_metrics(self, text):
+        try:
+            self.metrics_label.configure(text=text)
+        except Exception as e:
+            logger.error(f"Error updating metrics: {e}")
+
+    def on_job_error(self, job, error):
+        self.show_notification(f"Error: {error}", True)
+
+    def on_job_progress(self, job, done, total, eta):
+        try:
+            if not self.jobs.is_current(job):
+                return
+            percent = 100 * done / max(total, 1)
+            self.progress.configure(value=percent)
+            eta_text = f", about {eta:.0f}s left" if eta is not None and done < total else ""
+            self.loading_label.configure(text=f"Casting stereogram spell... {percent:.0f}%{eta_text}")
+        except Exception as e:
+            logger.error(f"Error updating progress: {e}")
+
+    def on_job_status(self, job, text):
+        try:
+            if self.jobs.is_current(job):
+                self.loading_label.configure(text=text)
+        except Exception as e:
+            logger.error(f"Error updating status: {e}")
+
+    def on_job_finish(self, job):
+        if not self.jobs.active():
+            self.hide_loading()
+
+    def cancel_jobs(self):
+        self.jobs.cancel()
+        self.hide_loading()
+        self.show_notification("Spell interrupted")
+
+    def get_render_graph(self):
+        with self.render_graph_lock:
+            if self.render_graph is None:
+                from pipeline import RenderGraph
+                self.render_graph = RenderGraph()
+            return self.render_graph
+
+    def get_parallel_renderer(self, workers):
+        # Keep the process pool alive between renders; rebuild it only when the worker count changes
+        with self.parallel_renderer_lock:
+            if self.parallel_renderer is None or self.parallel_renderer.workers != workers:
+                from parallel import ParallelRenderer
+                if self.parallel_renderer is not None:
+                    self.parallel_renderer.close()
+                self.parallel_renderer = ParallelRenderer(workers)
+            return self.parallel_renderer
 
     def update_result_preview(self):
         try:
@@ -540,6 +886,19 @@ class StereogramSorcery:
         except Exception as e:
             logger.error(f"Error updating result preview: {e}")
 
+    def show_loading(self, text, determinate=False):
+        try:
+            self.loading_label.configure(text=text)
+            self.progress.stop()
+            if determinate:
+                self.progress.configure(mode='determinate', maximum=100, value=0)
+            else:
+                self.progress.configure(mode='indeterminate')
+                self.progress.start(10)
+            self.loading_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+        except Exception as e:
+            logger.error(f"Error showing loading frame: {e}")
+
     def hide_loading(self):
         try:
             self.progress.stop()
@@ -549,174 +908,128 @@ class StereogramSorcery:
 
     def download_stereogram(self):
         try:
+            import export
             if not self.result_img:
                 self.show_notification("No stereogram has been generated", True)
                 return
-            file_format = self.format_var.get()
+            formats = [fmt for fmt, var in (("png", self.png_var), ("jpeg", self.jpeg_var), ("webp", self.webp_var))
+                       if var.get()]
+            if not formats:
+                self.show_notification("Choose at least one output format", True)
+                return
+            extension = export.FORMATS[formats[0]][0]
             file_path = filedialog.asksaveasfilename(
                 title="Save Enchantment",
-                defaultextension=f".{file_format}",
-                filetypes=[(f"{file_format.upper()} files", f"*.{file_format}")],
-                initialfile=f"stereogram.{file_format}"
+                defaultextension=extension,
+                filetypes=[(f"{fmt.upper()} files", f"*{export.FORMATS[fmt][0]}") for fmt in formats],
+                initialfile=f"stereogram{extension}"
             )
             if not file_path:
                 return
-            if file_format == "jpeg":
-                quality = int(self.jpeg_quality_var.get() * 100)
-                self.result_img.save(file_path, quality=quality)
-            else:
-                self.result_img.save(file_path)
-            self.show_notification(f"Enchantment saved as {os.path.basename(file_path)}")
+            # One file per ticked format, sharing the chosen name
+            targets = export.targets_for(os.path.splitext(file_path)[0], formats,
+                                         compress_level=self.png_level_var.get(),
+                                         quality=int(self.jpeg_quality_var.get() * 100))
+            self.get_export_queue().submit(self.result_img, targets, self.result_message,
+                                           on_done=self.on_export_done, on_error=self.on_export_error)
+            self.show_notification(f"Saving {', '.join(fmt.upper() for fmt in formats)} in the background...")
         except Exception as e:
             logger.error(f"Error saving stereogram: {e}")
             self.show_notification(f"Error saving file: {e}", True)
 
+    def get_export_queue(self):
+        if self.exports is None:
+            from export import ExportQueue
+            self.exports = ExportQueue(dispatch=lambda callback: self.root.after(0, callback))
+        return self.exports
+
+    def on_export_done(self, results):
+        import export
+        self.set_metrics(f"Save: {export.summary(results)}")
+        names = ", ".join(os.path.basename(result["path"]) for result in results)
+        lost = [result["format"].upper() for result in results if result["payload"] is False]
+        if lost:
+            self.show_notification(f"Saved {names}; the secret spell did not survive {', '.join(lost)}", True)
+        else:
+            self.show_notification(f"Enchantment saved as {names}")
+
+    def on_export_error(self, error):
+        self.show_notification(f"Error saving file: {error}", True)
+
     def generate_with_ai(self):
         try:
-            if self.is_generating:
-                return
             prompt = self.ai_prompt.get("1.0", tk.END).strip()
             if not prompt:
                 self.show_notification("Please enter an incantation", True)
                 return
             gen_type = self.gen_type_var.get()
             api_key = self.api_key.get().strip() or self.default_api_key
-            self.is_generating = True
-            self.loading_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-            self.loading_label.configure(text=f"Conjuring {gen_type}...")
-            self.progress.start(10)
-            thread = threading.Thread(target=self._generate_with_ai_thread, args=(prompt, gen_type, api_key))
-            thread.daemon = True
-            thread.start()
+            self.show_loading(f"Conjuring {gen_type}...")
+            refresh = self.ai_refresh_var.get()
+            self.jobs.submit("ai", self._ai_job, prompt, gen_type, api_key, refresh,
+                             on_done=self.on_ai_done, on_error=self.on_job_error,
+                             on_status=self.on_job_status, on_finish=self.on_job_finish)
         except Exception as e:
             logger.error(f"Error initiating AI enchantment: {e}")
-            self.is_generating = False
 
-    def _generate_with_ai_thread(self, prompt, gen_type, api_key):
+    def _ai_job(self, job, prompt, gen_type, api_key, refresh):
+        import ai_cache
+        import numpy as np
+        job.status("Consulting the archive..." if not refresh else "Connecting to the arcane API...")
+        client = self.get_ai_client(api_key)
+        with instrument.collect() as records:
+            image, cached = ai_cache.generate(
+                client, prompt, gen_type, cache=self.get_ai_cache(), refresh=refresh,
+                on_retry=lambda attempt, delay, reason: job.status(
+                    f"The oracle is busy ({reason}), asking again in {delay:.0f}s..."))
+        if cached:
+            logger.info(f"Recalled {gen_type} from the AI cache")
+        return gen_type, prompt, image, np.array(image), instrument.summary(records)
+
+    def get_ai_client(self, api_key):
+        # One pooled client per key so repeated generations reuse keep-alive connections
+        with self.ai_client_lock:
+            if self.ai_client is None or self.ai_client.api_key != api_key:
+                from stability import StabilityClient
+                if self.ai_client is not None:
+                    self.ai_client.close()
+                self.ai_client = StabilityClient(api_key, host=self.api_host, engine=self.api_engine)
+            return self.ai_client
+
+    def get_ai_cache(self):
+        with self.ai_client_lock:
+            if self.ai_cache is None:
+                import ai_cache
+                self.ai_cache = ai_cache.ImageCache()
+            return self.ai_cache
+
+    def on_ai_done(self, job, result):
         try:
+            import loader
+            gen_type, prompt, image, image_array, metrics = result
+            self.set_metrics(f"AI {gen_type}: {metrics}")
             if gen_type == "depthMap":
-                enhanced_prompt = f"Depth map for {prompt}. Clear grayscale image with strong contrast."
-            else:
-                enhanced_prompt = f"{prompt}. Create a seamless repeating pattern with subtle details."
-            self.root.after(0, lambda: self.loading_label.configure(text="Connecting to the arcane API..."))
-            url = "https://api.stability.ai/v1/generation/stable-diffusion-v1-6/text-to-image"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "Accept": "application/json"
-            }
-            payload = {
-                "text_prompts": [{"text": enhanced_prompt, "weight": 1.0}],
-                "cfg_scale": 7,
-                "height": 512,
-                "width": 512,
-                "samples": 1,
-                "steps": 30
-            }
-            self.root.after(0, lambda: self.loading_label.configure(text="Awaiting the oracle's response..."))
-            response = requests.post(url, json=payload, headers=headers, timeout=60)
-            if response.status_code != 200:
-                error_message = f"API error: {response.status_code}"
-                try:
-                    error_json = response.json()
-                    if "message" in error_json:
-                        error_message += f" - {error_json['message']}"
-                except:
-                    pass
-                logger.error(f"API error details: {response.text}")
-                raise Exception(error_message)
-            response_json = response.json()
-            if "artifacts" in response_json and len(response_json["artifacts"]) > 0:
-                image_data = base64.b64decode(response_json["artifacts"][0]["base64"])
-                image = Image.open(BytesIO(image_data))
-            else:
-                raise Exception("No image data found in API response")
-            if gen_type == "depthMap":
-                if image.mode != "L":
-                    image = image.convert("L")
                 self.depth_img = image
-                self.depth_array = np.array(image)
-                self.root.after(0, lambda: self.depth_label.config(text=f"AI Generated ({prompt[:20]}...)"))
-                self.root.after(0, self.update_depth_preview)
-                self.root.after(0, lambda: self.preview_notebook.select(1))
-                self.root.after(0, lambda: self.show_notification("AI depth map conjured successfully"))
+                self.depth_source = loader.DepthSource.from_array(image_array, prompt)
+                self.depth_label.config(text=f"AI Generated ({prompt[:20]}...)")
+                self.update_depth_preview()
+                self.preview_notebook.select(1)
+                self.show_notification("AI depth map conjured successfully")
             else:
-                if image.mode != "RGB":
-                    image = image.convert("RGB")
                 self.pattern_img = image
-                self.pattern_array = np.array(image)
-                self.root.after(0, lambda: self.pattern_label.config(text=f"AI Generated ({prompt[:20]}...)"))
-                self.root.after(0, self.update_pattern_preview)
-                self.root.after(0, lambda: self.preview_notebook.select(2))
-                self.root.after(0, lambda: self.show_notification("AI pattern conjured successfully"))
+                self.pattern_label.config(text=f"AI Generated ({prompt[:20]}...)")
+                self.update_pattern_preview()
+                self.preview_notebook.select(2)
+                self.show_notification("AI pattern conjured successfully")
             if self.depth_img and self.pattern_img:
-                self.root.after(0, lambda: self.show_notification("Both magical ingredients acquired. Ready to cast the spell!"))
+                self.show_notification("Both magical ingredients acquired. Ready to cast the spell!")
         except Exception as e:
             logger.error(f"Error in AI enchantment: {e}")
-            self.root.after(0, lambda: self.show_notification(f"Error: {e}", True))
-        finally:
-            self.root.after(0, self.hide_loading)
-            self.is_generating = False
-
-    def embed_message(self, image, message):
-        try:
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-            img_array = np.array(image)
-            height, width, _ = img_array.shape
-            message_bytes = message.encode('utf-8')
-            length = len(message_bytes)
-            message_data = length.to_bytes(4, byteorder='big') + message_bytes
-            max_bytes = (height * width * 3) // 8
-            if len(message_data) > max_bytes:
-                raise ValueError(f"Message too large: {len(message_data)} bytes exceeds maximum of {max_bytes} bytes")
-            binary_message = ''.join(format(byte, '08b') for byte in message_data)
-            data_index = 0
-            for y in range(height):
-                for x in range(width):
-                    for c in range(3):
-                        if data_index < len(binary_message):
-                            img_array[y, x, c] = (img_array[y, x, c] & 0xFE) | int(binary_message[data_index])
-                            data_index += 1
-                        else:
-                            break
-                    if data_index >= len(binary_message):
-                        break
-                if data_index >= len(binary_message):
-                    break
-            return Image.fromarray(img_array)
-        except Exception as e:
-            logger.error(f"Error embedding message: {e}")
-            return image
 
     def extract_message(self, image):
         try:
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-            img_array = np.array(image)
-            height, width, _ = img_array.shape
-            binary_data = ''
-            for y in range(height):
-                for x in range(width):
-                    for c in range(3):
-                        binary_data += str(img_array[y, x, c] & 1)
-                        if len(binary_data) == 32:
-                            length = int(binary_data[:32], 2)
-                            total_bits_needed = 32 + (length * 8)
-                            while len(binary_data) < total_bits_needed:
-                                y_pos = (y * width * 3 + x * 3 + c + 1) // (width * 3)
-                                x_pos = ((y * width * 3 + x * 3 + c + 1) // 3) % width
-                                c_pos = (y * width * 3 + x * 3 + c + 1) % 3
-                                if y_pos >= height:
-                                    return "[ERR] Message data incomplete"
-                                binary_data += str(img_array[y_pos, x_pos, c_pos] & 1)
-                            message_bits = binary_data[32:total_bits_needed]
-                            message_bytes = bytearray(int(message_bits[i:i+8], 2) for i in range(0, len(message_bits), 8))
-                            try:
-                                return message_bytes.decode('utf-8')
-                            except UnicodeDecodeError:
-                                return "[ERR] Invalid UTF-8 data"
-            return "[ERR] No hidden message found"
+            import stego
+            return stego.extract_message(image)
         except Exception as e:
             logger.error(f"Error extracting message: {e}")
             return f"[ERR] Failed to extract message: {e}"
@@ -776,6 +1089,7 @@ class StereogramSorcery:
             if not file_path:
                 self.show_notification("Please select an image file", True)
                 return
+            from PIL import Image
             img = Image.open(file_path)
             message = self.extract_message(img)
             output_text.delete("1.0", tk.END)
@@ -824,7 +1138,7 @@ class StereogramSorcery:
             ])
             self.add_help_section(content, "Secret Spells", [
                 "Hide secret messages within your stereogram using ancient LSB steganography.",
-                "Note: Only PNG preserves the hidden spells flawlessly."
+                "Note: Only PNG and lossless WebP preserve the hidden spells flawlessly."
             ])
             ttk.Button(content, text="Close", command=dialog.destroy, style="Primary.TButton").pack(pady=20)
             def configure_canvas(event):
@@ -851,11 +1165,45 @@ class StereogramSorcery:
         except Exception as e:
             logger.error(f"Error adding help section: {e}")
 
+def report_startup(root, built, exit_after=False, trace_memory=False):
+    """Log when the window first paints, and which heavy modules had been imported by then."""
+    def painted():
+        now = time.perf_counter()
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        logger.info(f"Window painted {(now - STARTED) * 1000:.0f} ms after start "
+                    f"(built in {(built - STARTED) * 1000:.0f} ms; heavy modules loaded: {', '.join(loaded) or 'none'})")
+        if trace_memory:
+            # Tracing every allocation slows startup, so peak figures start from here
+            tracemalloc.start()
+        if exit_after:
+            root.destroy()
+
+    def exposed(event):
+        root.unbind("<Expose>", binding)
+        # Redraws triggered by the expose run as idle tasks; the window is painted once they have
+        root.after_idle(painted)
+
+    binding = root.bind("<Expose>", exposed, add="+")
+
+
 def main():
     try:
+        # --measure-startup logs the startup figures and closes the window as soon as it is painted
+        measure = "--measure-startup" in sys.argv[1:]
+        # Tracing slows every allocation, renders included, so peak figures in the status line are opt-in
+        trace_memory = "--trace-memory" in sys.argv[1:]
         root = tk.Tk()
         app = StereogramSorcery(root)
+        report_startup(root, time.perf_counter(), exit_after=measure, trace_memory=trace_memory)
         root.mainloop()
+        app.jobs.shutdown()
+        if app.exports is not None:
+            # Let queued saves finish writing before exiting
+            app.exports.shutdown(wait=True)
+        if app.ai_client is not None:
+            app.ai_client.close()
+        if app.parallel_renderer is not None:
+            app.parallel_renderer.close()
     except Exception as e:
         logger.error(f"Critical error in main: {e}")
         messagebox.showerror("Critical Error", f"An unexpected error occurred: {e}\n\nSee console for details.")
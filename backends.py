@@ -0,0 +1,302 @@
+"""
+Render backends.
+
+A render mode is an algorithm: ``classic`` is the app's original copy-left
+loop, ``linked`` the constraint-linking algorithm in ``sirds.py``. A backend
+is one implementation of a mode; every backend of a mode turns a
+contrast-adjusted depth map and a tiled pattern into the same stereogram,
+pixel for pixel, and they differ only in speed. Backends are registered per
+mode by name with a loader, so optional ones cost nothing until used:
+
+- ``reference``: a plain per-pixel Python loop, the definition of correct
+- ``numpy``: vectorized column sweeps (``engine.render_stereogram``, ``sirds.render_linked``)
+- ``numba``: the loop compiled by Numba and spread across rows, when installed
+
+Each backend also declares its working memory per pixel, output included,
+which ``band_rows`` uses to fit a render into a memory budget.
+
+``verify()`` renders randomized inputs with every available backend and
+compares them against ``reference``; ``python -m sorcery backends`` runs it.
+"""
+
+import importlib.util
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import engine
+import sirds
+
+logger = logging.getLogger("StereogramSorcery")
+
+DEFAULT_BACKEND = "numpy"
+DEFAULT_MODE = "classic"
+MODES = ("classic", "linked")
+# Working memory assumed for backends that do not declare theirs
+DEFAULT_BYTES_PER_PIXEL = 32
+# Full-size buffers of a render besides the kernel's: contrast-adjusted depth, tiled pattern, result
+FULL_BYTES_PER_PIXEL = 1 + 3 + 3
+# Shared-memory copies of the depth, pattern and output a multi-process render adds
+SHARED_BYTES_PER_PIXEL = 1 + 3 + 3
+
+Backend = namedtuple("Backend", ["name", "mode", "description", "load", "available", "bytes_per_pixel"])
+
+_registry = OrderedDict()
+_loaded = {}
+
+
+def _has_numba():
+    return importlib.util.find_spec("numba") is not None
+
+
+def register(name, load, description="", available=lambda: True, mode=DEFAULT_MODE,
+             bytes_per_pixel=DEFAULT_BYTES_PER_PIXEL):
+    """Add a backend; ``load()`` returns its ``render(depth_enhanced, pattern_array, shift_strength)``.
+
+    ``bytes_per_pixel`` is the peak memory a render allocates per pixel, its output included.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown render mode {mode!r}; choose from {', '.join(MODES)}")
+    _registry[mode, name] = Backend(name, mode, description, load, available, bytes_per_pixel)
+    _loaded.pop((mode, name), None)
+
+
+def names(available_only=True, mode=DEFAULT_MODE):
+    return [name for (m, name), backend in _registry.items()
+            if m == mode and (not available_only or backend.available())]
+
+
+def describe(name, mode=DEFAULT_MODE):
+    return _registry[mode, name].description
+
+
+def _key(name, mode):
+    if mode and mode not in MODES:
+        raise ValueError(f"Unknown render mode {mode!r}; choose from {', '.join(MODES)}")
+    key = (mode or DEFAULT_MODE, name or DEFAULT_BACKEND)
+    if key not in _registry:
+        raise ValueError(f"Unknown {key[0]} render backend {key[1]!r}; "
+                         f"choose from {', '.join(names(False, key[0]))}")
+    return key
+
+
+def get(name=None, mode=None):
+    """Return the render function of backend ``name`` (default ``DEFAULT_BACKEND``) for ``mode``."""
+    key = _key(name, mode)
+    if key not in _loaded:
+        backend = _registry[key]
+        if not backend.available():
+            raise ValueError(f"Render backend {key[1]!r} is not available on this host")
+        _loaded[key] = backend.load()
+    return _loaded[key]
+
+
+def bytes_per_pixel(name=None, mode=None):
+    return _registry[_key(name, mode)].bytes_per_pixel
+
+
+def band_rows(memory_budget, size, name=None, mode=None, workers=1):
+    """Rows per render band that keep a render of ``size`` (width, height) within ``memory_budget`` bytes.
+
+    Counts the render's full-size buffers, and the shared-memory copies when
+    ``workers`` is above one, plus one band in flight per worker.
+    """
+    width, height = size
+    workers = max(workers or 1, 1)
+    full = FULL_BYTES_PER_PIXEL + (SHARED_BYTES_PER_PIXEL if workers > 1 else 0)
+    rows = engine.budget_rows(memory_budget, width, bytes_per_pixel(name, mode) * workers, full * width * height)
+    return min(rows, max(height, 1))
+
+
+def render_reference(depth_enhanced, pattern_array, shift_strength):
+    """The original per-pixel loop, kept verbatim as the ground truth."""
+    height, width = depth_enhanced.shape[:2]
+    result_array = np.zeros((height, width, 3), dtype=np.uint8)
+    for y in range(height):
+        row = np.zeros((width, 3), dtype=np.uint8)
+        row[:shift_strength] = pattern_array[y, :shift_strength]
+        for x in range(shift_strength, width):
+            depth_val = depth_enhanced[y, x] / 255.0
+            shift = int(depth_val * shift_strength)
+            if x - shift < shift_strength:
+                row[x] = pattern_array[y, x]
+            else:
+                row[x] = row[x - shift]
+        result_array[y] = row
+    return result_array
+
+
+def _load_numba():
+    import numba
+
+    @numba.njit(cache=True, parallel=True)
+    def kernel(depth_enhanced, pattern_array, shift_strength, shifts, result):
+        height, width = depth_enhanced.shape
+        for y in numba.prange(height):
+            for x in range(width):
+                shift = shifts[depth_enhanced[y, x]]
+                # Columns left of shift_strength always satisfy this, as in the loop
+                if x - shift < shift_strength:
+                    for c in range(3):
+                        result[y, x, c] = pattern_array[y, x, c]
+                elif shift != 0:
+                    for c in range(3):
+                        result[y, x, c] = result[y, x - shift, c]
+
+    def render(depth_enhanced, pattern_array, shift_strength):
+        height, width = depth_enhanced.shape[:2]
+        result = np.zeros((height, width, 3), dtype=np.uint8)
+        kernel(np.ascontiguousarray(depth_enhanced, dtype=np.uint8),
+               np.ascontiguousarray(pattern_array, dtype=np.uint8), int(shift_strength),
+               engine.shift_table(shift_strength, np.int64), result)
+        return result
+
+    return render
+
+
+def _load_numba_linked():
+    import numba
+
+    @numba.njit(cache=True, parallel=True)
+    def kernel(depth, z, step, separation, pattern_array, result):
+        height, width = depth.shape
+        for y in numba.prange(height):
+            same = np.arange(width)
+            for x in range(width):
+                s = separation[depth[y, x]]
+                left = x - (s + (s & x & 1)) // 2
+                right = left + s
+                if left < 0 or right >= width:
+                    continue
+                visible = True
+                zt = np.float32(-np.inf)
+                t = 1
+                while visible and zt < 1 and t <= width:
+                    zt = z[depth[y, x]] + step[depth[y, x]] * np.float32(t)
+                    if x - t >= 0 and z[depth[y, x - t]] >= zt:
+                        visible = False
+                    elif x + t < width and z[depth[y, x + t]] >= zt:
+                        visible = False
+                    t += 1
+                if not visible:
+                    continue
+                linked = same[left]
+                while linked != left and linked != right:
+                    if linked < right:
+                        left = linked
+                        linked = same[left]
+                    else:
+                        same[left] = right
+                        left = right
+                        linked = same[left]
+                        right = linked
+                same[left] = right
+            for x in range(width - 1, -1, -1):
+                source = same[x]
+                for c in range(3):
+                    result[y, x, c] = pattern_array[y, x, c] if source == x else result[y, source, c]
+
+    def render(depth_enhanced, pattern_array, shift_strength):
+        height, width = depth_enhanced.shape[:2]
+        # The per-level tables come from NumPy so float32 rounding matches the other backends
+        z, separation, step = sirds.depth_tables(sirds.eye_separation(shift_strength))
+        result = np.zeros((height, width, 3), dtype=np.uint8)
+        kernel(np.ascontiguousarray(depth_enhanced, dtype=np.uint8), z, step, separation,
+               np.ascontiguousarray(pattern_array, dtype=np.uint8), result)
+        return result
+
+    return render
+
+
+# Working memory measured with tracemalloc on 1K and 4K renders
+register("reference", lambda: render_reference, "Original per-pixel Python loop (slow; ground truth)",
+         bytes_per_pixel=3)
+register("numpy", lambda: engine.render_stereogram, "Vectorized NumPy column sweep", bytes_per_pixel=11)
+register("numba", _load_numba, "Numba-compiled loop, parallel across rows", available=_has_numba,
+         bytes_per_pixel=3)
+register("reference", lambda: sirds.render_linked_reference, "Scalar constraint-linking loop (slow; ground truth)",
+         mode="linked", bytes_per_pixel=24)
+register("numpy", lambda: sirds.render_linked, "Column sweep over an array link table", mode="linked",
+         bytes_per_pixel=29)
+register("numba", _load_numba_linked, "Numba-compiled linking, parallel across rows", available=_has_numba,
+         mode="linked", bytes_per_pixel=3)
+
+
+def random_case(rng, max_size=48):
+    height = int(rng.integers(1, max_size + 1))
+    width = int(rng.integers(1, max_size + 1))
+    depth = rng.integers(0, 256, size=(height, width), dtype=np.uint8)
+    # Flat regions and extremes exercise the zero-shift and full-shift paths
+    if rng.random() < 0.5:
+        depth[:, : width // 2] = rng.choice([0, 255])
+    pattern = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    # Small shifts keep linked-mode separations inside the image; large ones hit the edge cases
+    limit = width + 3 if rng.random() < 0.5 else width // 4 + 2
+    shift_strength = int(rng.integers(0, limit))
+    return depth, pattern, shift_strength
+
+
+def verify(trials=50, seed=0, max_size=48, backends=None, modes=MODES):
+    """Compare each backend with its mode's ``reference`` on random inputs; return mismatch descriptions.
+
+    Also checks that ``engine.create_stereogram`` rejects a negative shift for
+    every backend, since the compiled kernels do no bounds checks of their own.
+    """
+    rng = np.random.default_rng(seed)
+    failures = []
+    for trial in range(trials):
+        depth, pattern, shift_strength = random_case(rng, max_size)
+        for mode in modes:
+            expected = get("reference", mode)(depth, pattern, shift_strength)
+            for name in backends or names(mode=mode):
+                if name == "reference":
+                    continue
+                actual = get(name, mode)(depth, pattern, shift_strength)
+                if actual.shape != expected.shape or not np.array_equal(actual, expected):
+                    mismatched = (int(np.any(actual != expected, axis=-1).sum())
+                                  if actual.shape == expected.shape else -1)
+                    failures.append(f"{mode}/{name}: trial {trial} ({depth.shape[1]}x{depth.shape[0]}, "
+                                    f"shift {shift_strength}) differs in {mismatched} pixels")
+    depth, pattern, _ = random_case(rng, max_size)
+    for mode in modes:
+        for name in backends or names(mode=mode):
+            try:
+                engine.create_stereogram(depth, pattern, -1, backend=name, mode=mode)
+            except ValueError:
+                continue
+            failures.append(f"{mode}/{name}: a negative shift strength was not rejected")
+    return failures
+
+
+def timings(size=(1024, 1024), repeats=3, backends=None, mode=DEFAULT_MODE):
+    """Best render time in seconds of each backend of ``mode`` on a synthetic input of ``size``."""
+    width, height = size
+    rng = np.random.default_rng(0)
+    depth = rng.integers(0, 256, size=(height, width), dtype=np.uint8)
+    pattern = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    results = {}
+    for name in backends or [name for name in names(mode=mode) if name != "reference"]:
+        render = get(name, mode)
+        # The first call may compile; only time steady-state runs
+        render(depth[:8, :8], pattern[:8, :8], engine.DEFAULT_SHIFT_STRENGTH)
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            render(depth, pattern, engine.DEFAULT_SHIFT_STRENGTH)
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+    return results
+
+
+def preferred():
+    """The backend to offer by default: compiled when available, otherwise NumPy."""
+    available = names()
+    return "numba" if "numba" in available else DEFAULT_BACKEND
+
+
+def fastest(size=(1024, 1024), mode=DEFAULT_MODE):
+    """Name of the quickest available backend of ``mode`` on this host."""
+    results = timings(size, mode=mode)
+    return min(results, key=results.get)
@@ -0,0 +1,300 @@
+"""
+Manifest-driven batch rendering.
+
+A manifest lists one stereogram per row, as CSV with a header row, a JSON
+array of objects, or JSONL:
+
+    id,depth,pattern,shift_strength,pattern_scale,contrast,message,format
+    cover,depths/cover.png,patterns/noise.png,20,1.0,0.03,hello,png
+
+Only ``depth`` and ``pattern`` are required; paths are relative to the
+manifest. Jobs run on a process pool, ordered so jobs sharing a pattern run
+close together. Each worker keeps a few decoded patterns, so a pattern is
+decoded once per worker rather than once per job. Nothing else outlives a job,
+which keeps a worker's memory within ``--memory-budget``. Every finished job is
+appended to a checkpoint file in the output directory. A rerun skips jobs
+already recorded there whose output still exists, so an interrupted batch
+resumes where it stopped. A worker process that dies fails only the jobs
+queued on it; a fresh pool renders the rest. Each run ends by writing
+``summary.json`` with per-job stage timings, including those of jobs rendered
+by earlier runs.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import engine
+import export
+import instrument
+import loader
+import parallel
+
+logger = logging.getLogger("StereogramSorcery")
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+SUMMARY_FILE = "summary.json"
+PATTERN_CACHE_SIZE = 8
+# Jobs handed to the pool at once; a worker that dies takes only these down with it
+JOBS_PER_WORKER = 2
+
+# Manifest columns besides depth and pattern, with their types and defaults
+FIELDS = {
+    "shift_strength": (int, engine.DEFAULT_SHIFT_STRENGTH),
+    "pattern_scale": (float, engine.DEFAULT_PATTERN_SCALE),
+    "contrast": (float, engine.DEFAULT_CONTRAST),
+    "message": (str, None),
+    "format": (str, "png"),
+    "mode": (str, None),
+    "backend": (str, None),
+}
+
+
+def job_key(job):
+    """Hash of everything that decides a job's output, so an edited manifest row is rendered again."""
+    fields = {name: job[name] for name in ("depth", "pattern", *FIELDS)}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _read_rows(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for line_no, row in enumerate(csv.DictReader(f), 2):
+                yield line_no, {name: value for name, value in row.items() if name and value not in ("", None)}
+            return
+        text = f.read()
+    if text.lstrip().startswith("["):
+        yield from enumerate(json.loads(text), 1)
+        return
+    for line_no, line in enumerate(text.splitlines(), 1):
+        if line.strip() and not line.lstrip().startswith("#"):
+            yield line_no, json.loads(line)
+
+
+def load_manifest(path):
+    """Read a CSV, JSON or JSONL manifest into job dicts with every field filled in."""
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    ids = set()
+    for line_no, row in _read_rows(path):
+        where = f"{path}:{line_no}"
+        if not isinstance(row, dict):
+            raise ValueError(f"{where}: expected an object")
+        job = {}
+        for name in ("depth", "pattern"):
+            if not row.get(name):
+                raise ValueError(f"{where}: missing {name!r}")
+            job[name] = os.path.normpath(os.path.join(base, str(row[name])))
+        for name, (kind, default) in FIELDS.items():
+            value = row.get(name)
+            if value is None:
+                value = default
+            try:
+                job[name] = None if value is None else kind(value)
+            except ValueError:
+                raise ValueError(f"{where}: {name!r} must be {kind.__name__}, not {value!r}") from None
+        job["format"] = job["format"].lower()
+        if job["format"] not in export.FORMATS:
+            raise ValueError(f"{where}: unknown format {job['format']!r}; choose from {', '.join(export.FORMATS)}")
+        job["key"] = job_key(job)
+        job["id"] = str(row.get("id") or f"{os.path.splitext(os.path.basename(job['depth']))[0]}-{job['key'][:8]}")
+        if job["id"] in ids:
+            raise ValueError(f"{where}: duplicate id {job['id']!r}")
+        ids.add(job["id"])
+        jobs.append(job)
+    return jobs
+
+
+def output_path(output_dir, job):
+    return os.path.join(output_dir, job["id"] + export.FORMATS[job["format"]][0])
+
+
+def load_checkpoint(path):
+    """``{id: record}`` of the jobs a checkpoint file records as done, the latest record of each."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a torn last line
+                continue
+            if record.get("status") == "ok":
+                done[record["id"]] = record
+    return done
+
+
+# Per-worker state: decoded patterns, which are small next to a render
+_patterns = OrderedDict()
+
+
+def _pattern(path):
+    key = (path, os.path.getmtime(path))
+    img = _patterns.get(key)
+    if img is None:
+        with instrument.stage("decode_pattern"):
+            img = engine.load_pattern(path).convert("RGB")
+        _patterns[key] = img
+        while len(_patterns) > PATTERN_CACHE_SIZE:
+            _patterns.popitem(last=False)
+    else:
+        _patterns.move_to_end(key)
+        instrument.cached("decode_pattern")
+    return img
+
+
+def _record(job):
+    return {"id": job["id"], "key": job["key"], "depth": job["depth"], "pattern": job["pattern"]}
+
+
+def render_job(job, output_dir, memory_budget=None):
+    """Render one manifest job to its output file and return its result record."""
+    record = _record(job)
+    started = time.perf_counter()
+    try:
+        with instrument.muted(), instrument.collect() as records:
+            pattern_img = _pattern(job["pattern"])
+            with instrument.stage("decode_depth"):
+                depth_array = loader.load_depth(job["depth"])
+            result_img = engine.create_stereogram(depth_array, pattern_img, job["shift_strength"],
+                                                  job["pattern_scale"], job["contrast"], message=job["message"],
+                                                  backend=job["backend"], mode=job["mode"],
+                                                  memory_budget=memory_budget)
+            path = output_path(output_dir, job)
+            target = export.Target(job["format"], path, export.encoder_options(job["format"]))
+            saved = export.export(result_img, [target], job["message"])[0]
+        record.update(status="ok", path=path, bytes=saved["bytes"], payload=saved["payload"])
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    timings = {}
+    for stage in records:
+        if "parent" not in stage:
+            timings[stage["stage"]] = "cached" if stage.get("cached") else stage["wall_ms"]
+    record["stages"] = timings
+    return record
+
+
+def _new_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=parallel._pool_context(),
+                               initializer=loader.allow_large_images)
+
+
+def render_pooled(jobs, output_dir, workers, memory_budget=None):
+    """Yield the result record of each job as a process pool finishes it.
+
+    If a worker process dies, the jobs the broken pool held are recorded as
+    errors (a rerun retries them) and a fresh pool renders the rest.
+    """
+    queue = deque(jobs)
+    in_flight = {}
+    pool = _new_pool(workers)
+    try:
+        while queue or in_flight:
+            while queue and len(in_flight) < workers * JOBS_PER_WORKER:
+                try:
+                    future = pool.submit(render_job, queue[0], output_dir, memory_budget)
+                except BrokenProcessPool:
+                    pool = _restart(pool, workers)
+                    continue
+                in_flight[future] = (queue.popleft(), pool, time.perf_counter())
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, job_pool, submitted = in_flight.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool as e:
+                    if job_pool is pool:
+                        pool = _restart(pool, workers)
+                    yield dict(_record(job), status="error", error=f"BrokenProcessPool: {e}",
+                               seconds=round(time.perf_counter() - submitted, 3), stages={})
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def _restart(pool, workers):
+    logger.error("A batch worker process died; restarting the pool for the remaining jobs")
+    pool.shutdown(wait=False, cancel_futures=True)
+    return _new_pool(workers)
+
+
+def stage_totals(records):
+    """Total and mean milliseconds per stage over ``records``, with how often the stage was cached."""
+    totals = OrderedDict()
+    for record in records:
+        for stage, ms in record.get("stages", {}).items():
+            entry = totals.setdefault(stage, {"runs": 0, "cached": 0, "total_ms": 0.0})
+            if ms == "cached":
+                entry["cached"] += 1
+            else:
+                entry["runs"] += 1
+                entry["total_ms"] = round(entry["total_ms"] + ms, 2)
+    for entry in totals.values():
+        entry["mean_ms"] = round(entry["total_ms"] / entry["runs"], 2) if entry["runs"] else None
+    return totals
+
+
+def run(manifest_path, output_dir, workers=None, checkpoint=None, memory_budget=None):
+    """Render every manifest job not already checkpointed; return the summary dict, also saved as ``summary.json``.
+
+    ``rendered``, ``failed`` and the throughput cover this run. ``results`` and
+    the stage totals cover every job in the manifest, taking skipped jobs from
+    the checkpoint.
+    """
+    jobs = load_manifest(manifest_path)
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = checkpoint or os.path.join(output_dir, CHECKPOINT_FILE)
+    done = load_checkpoint(checkpoint)
+    pending = [job for job in jobs
+               if done.get(job["id"], {}).get("key") != job["key"] or not os.path.exists(output_path(output_dir, job))]
+    skipped = len(jobs) - len(pending)
+    if skipped:
+        logger.info(f"Resuming batch: {skipped} of {len(jobs)} stereograms already rendered")
+    # Neighbouring jobs with the same pattern land on workers that already decoded it
+    pending.sort(key=lambda job: (job["pattern"], job["pattern_scale"]))
+    workers = max(1, workers or parallel.default_workers())
+    started = time.perf_counter()
+    records = []
+    with open(checkpoint, "a", encoding="utf-8") as log:
+        if workers == 1 or len(pending) <= 1:
+            results = (render_job(job, output_dir, memory_budget) for job in pending)
+        else:
+            results = render_pooled(pending, output_dir, workers, memory_budget)
+        try:
+            for count, record in enumerate(results, 1):
+                log.write(json.dumps(record) + "\n")
+                log.flush()
+                records.append(record)
+                logger.info(f"[{count}/{len(pending)}] {record['id']}: {record['status']} in {record['seconds']:.2f} s")
+                if record["status"] != "ok":
+                    logger.error(f"Batch job {record['id']} failed: {record['error']}")
+        finally:
+            results.close()
+    wall = time.perf_counter() - started
+    failed = sum(1 for record in records if record["status"] != "ok")
+    # Skipped jobs keep the records of the run that rendered them, so the results cover the whole manifest
+    pending_ids = {job["id"] for job in pending}
+    results = records + [done[job["id"]] for job in jobs if job["id"] not in pending_ids]
+    summary = {
+        "manifest": os.path.abspath(manifest_path),
+        "jobs": len(jobs),
+        "skipped": skipped,
+        "rendered": len(records) - failed,
+        "failed": failed,
+        "workers": workers,
+        "wall_s": round(wall, 3),
+        "jobs_per_s": round(len(records) / wall, 3) if records and wall > 0 else None,
+        "stages": stage_totals(results),
+        "results": sorted(results, key=lambda record: record["id"]),
+    }
+    with open(os.path.join(output_dir, SUMMARY_FILE), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
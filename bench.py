@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Render benchmark suite.
+
+Times the classic and constraint-linked render kernels, contrast adjustment, pattern tiling, message
+embedding and extraction on synthetic depth maps and patterns across a matrix
+of image sizes, shift strengths and payload sizes. Each case reports the best
+wall time over a few repeats, throughput in megapixels per second and peak
+traced memory, and the results can be written as JSON. Given a baseline JSON
+from an earlier run, cases whose throughput dropped by more than the
+threshold are reported and the run exits non-zero:
+
+    python bench.py --sizes 512 1K 2K -o baseline.json
+    python bench.py --sizes 512 1K 2K --baseline baseline.json --threshold 0.15
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+import backends
+import engine
+import stego
+
+logger = logging.getLogger("StereogramSorcery")
+
+SIZES = {
+    "512": (512, 512),
+    "1K": (1024, 1024),
+    "2K": (2048, 2048),
+    "4K": (3840, 2160),
+    "8K": (7680, 4320),
+}
+DEFAULT_SIZES = ("512", "1K", "2K", "4K")
+DEFAULT_SHIFTS = (15, 40)
+DEFAULT_PAYLOADS = (16, 1024, 65536)
+DEFAULT_REPEATS = 3
+DEFAULT_THRESHOLD = 0.2
+STAGES = ("render", "render_linked", "contrast", "tile", "embed", "extract")
+
+
+def synthetic_depth(width, height, seed=0):
+    """A smooth depth field with a few raised discs, like a typical depth map."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    depth = 96 + 64 * np.sin(x / width * 6.0) * np.cos(y / height * 4.0)
+    for cx, cy, r in rng.uniform(0, 1, size=(6, 3)):
+        radius = (0.05 + 0.15 * r) * min(width, height)
+        inside = (x - cx * width) ** 2 + (y - cy * height) ** 2 < radius ** 2
+        depth[inside] = 230
+    return depth.astype(np.uint8)
+
+
+def synthetic_pattern(size=128, seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8), "RGB")
+
+
+def synthetic_message(nbytes):
+    return ("sorcery " * (nbytes // 8 + 1))[:nbytes]
+
+
+def measure(fn, repeats):
+    """Return ``(best_seconds, peak_bytes)``.
+
+    Peak memory is traced in a separate untimed first run, which also absorbs
+    one-off costs such as JIT compilation.
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best, peak
+
+
+def bench_size(label, shifts, payloads, repeats, stages=STAGES, backend=None):
+    width, height = SIZES[label]
+    megapixels = width * height / 1e6
+    depth = synthetic_depth(width, height)
+    pattern = synthetic_pattern()
+    depth_enhanced = engine.adjust_contrast(depth, engine.DEFAULT_CONTRAST)
+    pattern_array = engine.tile_pattern(pattern, (width, height))
+
+    cases = [
+        ("contrast", {}, lambda: engine.adjust_contrast(depth, engine.DEFAULT_CONTRAST)),
+        ("tile", {}, lambda: engine.tile_pattern(pattern, (width, height))),
+    ]
+    render = backends.get(backend, "classic")
+    render_linked = backends.get(backend, "linked")
+    for shift in shifts:
+        cases.append(("render", {"shift": shift},
+                      lambda shift=shift: render(depth_enhanced, pattern_array, shift)))
+        cases.append(("render_linked", {"shift": shift},
+                      lambda shift=shift: render_linked(depth_enhanced, pattern_array, shift)))
+    result = Image.fromarray(engine.render_stereogram(depth_enhanced, pattern_array, engine.DEFAULT_SHIFT_STRENGTH))
+    capacity = stego.capacity_bytes((height, width, 3))
+    for nbytes in payloads:
+        if nbytes > capacity:
+            continue
+        message = synthetic_message(nbytes)
+        stamped = stego.embed_message(result, message)
+        cases.append(("embed", {"payload": nbytes}, lambda message=message: stego.embed_message(result, message)))
+        cases.append(("extract", {"payload": nbytes}, lambda stamped=stamped: stego.extract_message(stamped)))
+
+    records = []
+    for stage, params, fn in cases:
+        if stage not in stages:
+            continue
+        seconds, peak = measure(fn, repeats)
+        record = {
+            "stage": stage,
+            "size": label,
+            "width": width,
+            "height": height,
+            **params,
+            "seconds": round(seconds, 6),
+            "mp_per_s": round(megapixels / seconds, 3),
+            "peak_mb": round(peak / 2 ** 20, 2),
+        }
+        logger.info(format_record(record))
+        records.append(record)
+    return records
+
+
+def case_key(record):
+    return (record["stage"], record["size"], record.get("shift"), record.get("payload"))
+
+
+def format_record(record):
+    extra = "".join(f" {name}={record[name]}" for name in ("shift", "payload") if name in record)
+    return (f"{record['stage']:<13} {record['size']:>4}{extra:<16} {record['seconds'] * 1000:9.1f} ms "
+            f"{record['mp_per_s']:9.1f} MP/s {record['peak_mb']:9.1f} MB")
+
+
+def check_baseline(baseline, backend=None):
+    """Raise ValueError if ``baseline`` was recorded with another backend, since render timings depend on it."""
+    backend = backend or backends.DEFAULT_BACKEND
+    baseline_backend = baseline.get("backend") or backends.DEFAULT_BACKEND
+    if baseline_backend != backend:
+        raise ValueError(f"Baseline was recorded with the {baseline_backend!r} backend, not {backend!r}; "
+                         f"rerun it with --backend {backend} or pass --backend {baseline_backend}")
+
+
+def compare(records, baseline, threshold, backend=None):
+    """Return the cases whose throughput fell more than ``threshold`` below the baseline.
+
+    A baseline recorded with a different backend than ``backend`` is refused
+    rather than compared (see ``check_baseline``).
+    """
+    check_baseline(baseline, backend)
+    previous = {case_key(record): record for record in baseline["results"]}
+    regressions = []
+    for record in records:
+        old = previous.get(case_key(record))
+        if old is None:
+            continue
+        change = record["mp_per_s"] / old["mp_per_s"] - 1
+        if change < -threshold:
+            regressions.append({**record, "baseline_mp_per_s": old["mp_per_s"], "change": round(change, 3)})
+    return regressions
+
+
+def run(sizes=DEFAULT_SIZES, shifts=DEFAULT_SHIFTS, payloads=DEFAULT_PAYLOADS, repeats=DEFAULT_REPEATS, stages=STAGES,
+        backend=None):
+    records = []
+    for label in sizes:
+        records.extend(bench_size(label, shifts, payloads, repeats, stages, backend))
+    return {
+        "backend": backend or backends.DEFAULT_BACKEND,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeats": repeats,
+        "results": records,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="bench", description="Benchmark the stereogram render stages")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(DEFAULT_SIZES), help="image sizes")
+    parser.add_argument("--shifts", nargs="+", type=int, default=list(DEFAULT_SHIFTS), help="render shift strengths")
+    parser.add_argument("--payloads", nargs="+", type=int, default=list(DEFAULT_PAYLOADS),
+                        help="message sizes in bytes for embed/extract")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="stages to run")
+    parser.add_argument("--backend", help="render backend for both render modes (default numpy)")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="timed runs per case (best is kept)")
+    parser.add_argument("-o", "--output", help="write results as JSON here")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fail when throughput drops by more than this fraction of the baseline")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    baseline = None
+    if args.baseline:
+        # Checked before the run, which can take minutes at the larger sizes
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        try:
+            check_baseline(baseline, args.backend)
+        except ValueError as e:
+            logger.error(str(e))
+            return 2
+    report = run(args.sizes, args.shifts, args.payloads, args.repeats, args.stages, args.backend)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if baseline is None:
+        return 0
+    regressions = compare(report["results"], baseline, args.threshold, report["backend"])
+    for record in regressions:
+        logger.error(f"REGRESSION {format_record(record)} (baseline {record['baseline_mp_per_s']} MP/s, "
+                     f"{record['change']:+.0%})")
+    if regressions:
+        return 1
+    logger.info(f"No stage regressed by more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Stereogram render engine.
+
+Tk-free rendering kernels used by the Stereogram Sorcery app. Everything here
+works on plain NumPy arrays so it can be driven from the UI or from scripts.
+"""
+
+import numpy as np
+from PIL import Image
+
+import instrument
+from stego import embed_message_array
+
+DEFAULT_SHIFT_STRENGTH = 15
+DEFAULT_PATTERN_SCALE = 1.0
+DEFAULT_CONTRAST = 0.03
+DEFAULT_CHUNK_ROWS = 128
+# Elements per table lookup or colour gather; bounds the index copies NumPy makes
+LOOKUP_CHUNK = 1 << 18
+
+
+def lookup(table, values, chunk=LOOKUP_CHUNK):
+    """``table[values]`` as a new array of ``table``'s dtype, gathered ``chunk`` elements at a time.
+
+    NumPy widens index arrays to ``intp`` before a gather; going in chunks
+    keeps that copy small instead of eight bytes for every value.
+    """
+    values = np.ascontiguousarray(values)
+    result = np.empty(values.shape, dtype=table.dtype)
+    flat_values = values.reshape(-1)
+    flat_result = result.reshape(-1)
+    for start in range(0, flat_values.size, chunk):
+        np.take(table, flat_values[start:start + chunk], out=flat_result[start:start + chunk])
+    return result
+
+
+def check_shift_strength(shift_strength):
+    """Reject negative shifts, which the compiled backends would turn into reads past the row."""
+    if shift_strength < 0:
+        raise ValueError(f"Shift strength must be at least 0, not {shift_strength}")
+    return shift_strength
+
+
+def shift_table(shift_strength, dtype=np.int32):
+    """Shift in pixels for each 8-bit depth level, as the reference loop computes it."""
+    # Same float math as the loop: int(depth / 255.0 * shift_strength)
+    return (np.arange(256) / 255.0 * int(shift_strength)).astype(dtype)
+
+
+def render_stereogram(depth_enhanced, pattern_array, shift_strength):
+    """Render a stereogram from a contrast-adjusted depth map and a tiled pattern.
+
+    Produces exactly what the original per-pixel loop did: each pixel at column
+    x copies the pixel ``shift`` columns to its left (``shift`` being the depth
+    scaled to ``shift_strength``), or takes the pattern when that would reach
+    into the first ``shift_strength`` columns. Rather than walking pixels, every
+    pixel is resolved to the pattern pixel it ends up showing with one column
+    sweep across all rows, and the colours are gathered in a single pass.
+    """
+    height, width = depth_enhanced.shape[:2]
+    shift_strength = int(shift_strength)
+    lead = min(max(shift_strength, 0), width)
+    index_dtype = np.int32 if height * width < 2 ** 31 - 1 else np.int64
+
+    # Work column-major so each step of the sweep reads and writes contiguous memory
+    shifts = lookup(shift_table(shift_strength, index_dtype), depth_enhanced.T)
+    cols = np.arange(width, dtype=index_dtype)[:, None]
+    rows = np.arange(height, dtype=index_dtype)
+    # x - shift < shift_strength, compared against a single column of thresholds
+    from_pattern = shifts > cols - shift_strength
+    # A zero shift copies the still-empty pixel itself, which the loop left black
+    linked = ~from_pattern & (shifts != 0)
+
+    # source holds the flat pattern index each pixel shows, -1 meaning black.
+    # Every pixel has a pointer to the pixel it copies; unlinked pixels point at
+    # themselves, so each step of the sweep is one plain gather.
+    source = cols + rows * width
+    np.putmask(source, ~from_pattern, -1)
+    del from_pattern
+    # The pointer of (x, y) is (x - shift) * height + y, built in place over the shifts
+    pointer = shifts
+    pointer *= linked
+    del linked
+    np.subtract(cols, pointer, out=pointer)
+    pointer *= height
+    pointer += rows
+    flat = source.reshape(-1)
+    for x in range(lead, width):
+        source[x] = flat.take(pointer[x])
+    del pointer, shifts
+
+    return gather_pixels(pattern_array, source)
+
+
+def gather_pixels(pattern_array, source):
+    """The RGB image whose pixel (y, x) is ``pattern_array``'s pixel at flat index ``source[x, y]``.
+
+    ``source`` is column-major, as the render sweeps build it; -1 gives black.
+    Rows are gathered in bands so NumPy's widened copy of the indices stays small.
+    """
+    width, height = source.shape
+    pixels = np.asarray(pattern_array, dtype=np.uint8).reshape(height * width, 3)
+    result = np.empty((height, width, 3), dtype=np.uint8)
+    band = max(LOOKUP_CHUNK // max(width, 1), 1)
+    for y0 in range(0, height, band):
+        indices = source[:, y0:y0 + band].T
+        out = result[y0:y0 + band]
+        pixels.take(indices, axis=0, mode="clip", out=out)
+        out[indices < 0] = 0
+    return result
+
+
+def render_rows(depth_enhanced, pattern_array, shift_strength, progress=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                render=render_stereogram):
+    """Render like ``render_stereogram``, one band of ``chunk_rows`` rows at a time.
+
+    ``progress(rows_done, height)`` is called after every band; it may raise to
+    abandon the render between bands. ``render`` is the kernel used for each
+    band, e.g. one from ``backends.get``.
+    """
+    height, width = depth_enhanced.shape[:2]
+    result = np.empty((height, width, 3), dtype=np.uint8)
+    for y0 in range(0, height, chunk_rows):
+        y1 = min(y0 + chunk_rows, height)
+        result[y0:y1] = render(depth_enhanced[y0:y1], pattern_array[y0:y1], shift_strength)
+        if progress is not None:
+            progress(y1, height)
+    return result
+
+
+def _contrast(values, contrast_factor):
+    f = values.astype(np.float32)
+    if values.dtype.itemsize == 2:
+        # 16-bit depth maps are adjusted at full precision and quantized only at the end
+        f *= 1 / 257.0
+    # Use a gentler contrast adjustment by blending the original value with the full contrast effect.
+    # This prevents extreme clamping that can black out the image.
+    multiplier = 0.5 * contrast_factor + 0.5  # When contrast_factor is 1.0, multiplier is 1.0
+    adjusted = (f - 128) * multiplier + 128
+    adjusted = np.clip(adjusted, 0, 255)
+    return adjusted.astype(np.uint8)
+
+
+def contrast_table(contrast_factor, dtype=np.uint8):
+    """Contrast-adjusted 8-bit depth for every level of an 8- or 16-bit ``dtype`` (256 or 65536 entries)."""
+    dtype = np.dtype(dtype)
+    return _contrast(np.arange(np.iinfo(dtype).max + 1, dtype=dtype), contrast_factor)
+
+
+def budget_rows(memory_budget, width, bytes_per_pixel, fixed_bytes=0):
+    """Most rows per band for which ``fixed_bytes`` plus one band of ``bytes_per_pixel`` fits ``memory_budget``."""
+    row_bytes = max(width, 1) * bytes_per_pixel
+    rows = (int(memory_budget) - fixed_bytes) // row_bytes
+    if rows < 1:
+        raise ValueError(f"A memory budget of {int(memory_budget) / 2 ** 20:.1f} MB is too small for this render; "
+                         f"it needs at least {(fixed_bytes + row_bytes) / 2 ** 20:.1f} MB")
+    return int(rows)
+
+
+def adjust_contrast(image_array, contrast_factor):
+    """Contrast-adjusted 8-bit copy of a depth map.
+
+    8- and 16-bit maps go through ``contrast_table``, one gather with no float
+    copy of the map; other dtypes take the same float math directly.
+    """
+    image_array = np.asarray(image_array)
+    if image_array.dtype.kind != "u" or image_array.dtype.itemsize > 2:
+        return _contrast(image_array, contrast_factor)
+    return lookup(contrast_table(contrast_factor, image_array.dtype), image_array)
+
+
+def scale_pattern(pattern_img, pattern_scale=1.0):
+    """Resize the pattern by ``pattern_scale`` and return it as an RGB array."""
+    pattern_width = max(int(pattern_img.width * pattern_scale), 1)
+    pattern_height = max(int(pattern_img.height * pattern_scale), 1)
+    return np.array(pattern_img.resize((pattern_width, pattern_height), Image.LANCZOS).convert("RGB"))
+
+
+def tile_array(tile, size):
+    """Repeat an RGB tile from the top-left corner to cover ``size`` (width, height)."""
+    width, height = size
+    tile_height, tile_width = tile.shape[:2]
+    reps = (-(-height // tile_height), -(-width // tile_width), 1)
+    return np.ascontiguousarray(np.tile(tile, reps)[:height, :width])
+
+
+def tile_pattern(pattern_img, size, pattern_scale=1.0):
+    """Scale the pattern by ``pattern_scale`` and tile it over an RGB array of ``size``."""
+    return tile_array(scale_pattern(pattern_img, pattern_scale), size)
+
+
+def create_stereogram(depth_array, pattern, shift_strength=DEFAULT_SHIFT_STRENGTH,
+                      pattern_scale=DEFAULT_PATTERN_SCALE, contrast=DEFAULT_CONTRAST, message=None,
+                      workers=None, backend=None, mode=None, memory_budget=None):
+    """Run the whole pipeline and return the stereogram as an RGB image.
+
+    ``depth_array`` is a 2-D 8- or 16-bit grayscale array, ``pattern`` an RGB array or a PIL
+    image. When ``message`` is given it is hidden in the result with LSB
+    steganography. With ``workers`` above one, row bands are rendered on that
+    many processes (see ``parallel.py``). ``mode`` picks the algorithm
+    (``"classic"`` or ``"linked"``) and ``backend`` its implementation, both
+    from ``backends.py``; backends of a mode produce identical pixels. With
+    ``memory_budget`` (bytes), the render runs in row bands sized so its peak
+    memory stays within the budget. For repeated renders that change one
+    parameter at a time, ``pipeline.RenderGraph`` reuses unchanged stages.
+    """
+    depth_array = np.asarray(depth_array)
+    if depth_array.ndim != 2:
+        raise ValueError(f"Depth map must be a 2-D array, got shape {depth_array.shape}")
+    check_shift_strength(shift_strength)
+    if not isinstance(pattern, Image.Image):
+        pattern = Image.fromarray(np.asarray(pattern, dtype=np.uint8))
+    height, width = depth_array.shape
+    with instrument.stage("contrast"):
+        depth_enhanced = adjust_contrast(depth_array, contrast)
+    with instrument.stage("pattern_resize"):
+        tile = scale_pattern(pattern, pattern_scale)
+    with instrument.stage("tile"):
+        pattern_array = tile_array(tile, (width, height))
+    band_rows = None
+    if memory_budget:
+        import backends
+        band_rows = backends.band_rows(memory_budget, (width, height), backend, mode, workers)
+    with instrument.stage("render", workers=workers or 1, backend=backend or "numpy", mode=mode or "classic") as record:
+        if band_rows:
+            record["band_rows"] = band_rows
+        if workers and workers > 1:
+            from parallel import render_parallel
+            result_array = render_parallel(depth_enhanced, pattern_array, shift_strength, workers, backend, mode,
+                                           band_rows)
+        elif band_rows:
+            import backends
+            result_array = render_rows(depth_enhanced, pattern_array, shift_strength, chunk_rows=band_rows,
+                                       render=backends.get(backend, mode))
+        elif backend or mode:
+            import backends
+            result_array = backends.get(backend, mode)(depth_enhanced, pattern_array, shift_strength)
+        else:
+            result_array = render_stereogram(depth_enhanced, pattern_array, shift_strength)
+    if message:
+        with instrument.stage("stego", payload=len(message.encode("utf-8"))):
+            embed_message_array(result_array, message)
+    return Image.fromarray(result_array)
+
+
+def preview_size(size, bounds):
+    """Largest size with the aspect ratio of ``size`` that fits in ``bounds``, never upscaled."""
+    width, height = size
+    scale = min(bounds[0] / max(width, 1), bounds[1] / max(height, 1), 1.0)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def downscale_depth(depth_array, size):
+    """Reduce an 8- or 16-bit depth map to ``size`` (width, height) for previews."""
+    if depth_array.dtype.itemsize == 2:
+        # Pillow cannot resample 16-bit images; its 32-bit integer mode can
+        img = Image.fromarray(depth_array.astype(np.int32), "I")
+        return np.array(img.resize(size, Image.BILINEAR, reducing_gap=2.0)).astype(np.uint16)
+    img = Image.fromarray(depth_array)
+    return np.array(img.resize(size, Image.BILINEAR, reducing_gap=2.0))
+
+
+def render_preview(depth_preview, pattern_img, shift_strength, pattern_scale, contrast, factor, backend=None,
+                   mode=None):
+    """Render a stereogram from a depth map already downscaled by ``factor``.
+
+    Shift strength and pattern scale are scaled by the same factor so the
+    preview looks like a shrunk copy of the full-resolution result. No message
+    is embedded.
+    """
+    shift = max(1, int(round(shift_strength * factor)))
+    # Preview frames arrive many times a second while dragging; keep them out of the log
+    with instrument.muted():
+        return create_stereogram(depth_preview, pattern_img, shift, pattern_scale * factor, contrast,
+                                 backend=backend, mode=mode)
+
+
+def load_pattern(path):
+    img = Image.open(path)
+    img.load()
+    return img
@@ -0,0 +1,158 @@
+"""
+Multi-format export.
+
+``export(img, targets, message)`` writes one in-memory stereogram to several
+files in a single job. Each target is encoded into memory from the same RGB
+buffer and written atomically. When a hidden message is expected, the target
+is decoded again to check that the message survived. Every target reports its
+encode time and size, so the cheapest format that keeps the payload is easy
+to pick: PNG and lossless WebP always keep it, and JPEG does not.
+
+``ExportQueue`` runs exports one after another on a background thread in
+submission order. Like ``jobs.JobScheduler``, it hands results back through
+a ``dispatch`` function. Unlike render jobs, a new export never cancels one
+already queued.
+"""
+
+import logging
+import os
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+import instrument
+import stego
+
+logger = logging.getLogger("StereogramSorcery")
+
+# Format name: (file extension, Pillow format)
+FORMATS = OrderedDict([
+    ("png", (".png", "PNG")),
+    ("jpeg", (".jpg", "JPEG")),
+    ("webp", (".webp", "WEBP")),
+])
+EXTENSIONS = {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp"}
+DEFAULT_COMPRESS_LEVEL = 6
+DEFAULT_JPEG_QUALITY = 85
+
+Target = namedtuple("Target", ["format", "path", "options"], defaults=(None,))
+
+
+def format_for_path(path):
+    """Export format for ``path``'s extension; other formats Pillow can write are saved with its defaults."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in EXTENSIONS:
+        return EXTENSIONS[ext]
+    registered = Image.registered_extensions()
+    if ext in registered and registered[ext] in Image.SAVE:
+        return registered[ext].lower()
+    raise ValueError(f"Cannot export to {ext or 'a file without an extension'}; use .png, .jpg or .webp")
+
+
+def encoder_options(fmt, compress_level=DEFAULT_COMPRESS_LEVEL, quality=DEFAULT_JPEG_QUALITY):
+    """Pillow save options for ``fmt``: PNG compress level, JPEG quality, lossless WebP."""
+    if fmt == "png":
+        return {"compress_level": compress_level}
+    if fmt == "jpeg":
+        return {"quality": quality}
+    if fmt == "webp":
+        return {"lossless": True}
+    return {}
+
+
+def targets_for(base_path, formats, compress_level=DEFAULT_COMPRESS_LEVEL, quality=DEFAULT_JPEG_QUALITY):
+    """One target per format, named ``base_path`` plus the format's extension."""
+    return [Target(fmt, base_path + FORMATS[fmt][0], encoder_options(fmt, compress_level, quality))
+            for fmt in formats]
+
+
+def encode(img, fmt, options=None):
+    buffer = BytesIO()
+    img.save(buffer, format=FORMATS[fmt][1] if fmt in FORMATS else fmt.upper(), **(options or {}))
+    return buffer.getvalue()
+
+
+def write_atomic(path, data):
+    """Write ``data`` to ``path`` through a temporary file, so a failed save never leaves half a file."""
+    # A plain open (unlike mkstemp) gives the file the usual umask permissions
+    tmp_path = f"{path}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def export(img, targets, message=None):
+    """Encode ``img`` into every target and return one report dict per target.
+
+    ``payload`` in a report is True when ``message`` decodes from the written
+    file, False when it does not, and None when no message was given.
+    """
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.load()
+    results = []
+    for target in targets:
+        with instrument.stage("save", format=target.format) as record:
+            with instrument.stage("encode", format=target.format) as encoded:
+                data = encode(img, target.format, target.options)
+            write_atomic(target.path, data)
+            record["bytes"] = len(data)
+            result = {
+                "format": target.format,
+                "path": target.path,
+                "bytes": len(data),
+                "encode_ms": encoded["wall_ms"],
+                "payload": None,
+            }
+            if message:
+                with instrument.stage("verify", format=target.format), Image.open(BytesIO(data)) as decoded:
+                    result["payload"] = stego.extract_message(decoded) == message
+        results.append(result)
+    return results
+
+
+def summary(results):
+    """One-line report, e.g. ``PNG 812 ms 4.1 MB payload kept · JPEG 95 ms 870 KB payload lost``."""
+    parts = []
+    for result in results:
+        size = result["bytes"]
+        size_text = f"{size / 2 ** 20:.1f} MB" if size >= 2 ** 20 else f"{size / 1024:.0f} KB"
+        text = f"{result['format'].upper()} {result['encode_ms']:.0f} ms {size_text}"
+        if result["payload"] is not None:
+            text += " payload kept" if result["payload"] else " payload lost"
+        parts.append(text)
+    return " · ".join(parts)
+
+
+class ExportQueue:
+    def __init__(self, dispatch=None):
+        self.dispatch = dispatch or (lambda callback: callback())
+        # One worker keeps exports in submission order and off the render threads
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sorcery-export")
+
+    def submit(self, img, targets, message=None, on_done=None, on_error=None):
+        """Queue an export; ``on_done(results)`` or ``on_error(exc)`` is dispatched when it finishes."""
+        def run():
+            try:
+                results = export(img, targets, message)
+            except Exception as e:
+                logger.error(f"Export failed: {e}")
+                if on_error is not None:
+                    self.dispatch(lambda e=e: on_error(e))
+                return
+            logger.info(f"Exported {summary(results)}")
+            if on_done is not None:
+                self.dispatch(lambda: on_done(results))
+
+        return self.executor.submit(run)
+
+    def shutdown(self, wait=True):
+        """Stop taking exports; with ``wait``, finish the queued ones first."""
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,143 @@
+"""
+Per-stage timing and memory instrumentation.
+
+``stage(name, **fields)`` wraps one piece of work and records its wall time,
+the CPU time of the calling thread and, while ``tracemalloc`` is tracing, its
+peak allocation above the level it started at. Every record is logged as one
+JSON object through the ``StereogramSorcery`` logger and appended to each
+``collect()`` block open on the same thread, which is how a render job gathers
+the figures for the app's status line. ``profiled(path)`` writes a cProfile
+dump of a single block.
+
+tracemalloc peaks are process-wide, so figures for stages that overlap on
+different threads include each other's allocations.
+"""
+
+import cProfile
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger("StereogramSorcery")
+
+_local = threading.local()
+
+
+def _state():
+    if not hasattr(_local, "frames"):
+        _local.frames = []
+        _local.collectors = []
+        _local.muted = 0
+    return _local
+
+
+def _emit(record):
+    state = _state()
+    for records in state.collectors:
+        records.append(record)
+    if not state.muted:
+        logger.info(json.dumps(record))
+
+
+@contextmanager
+def stage(name, **fields):
+    """Time the block as stage ``name``; yields the record so callers can add fields."""
+    state = _state()
+    frames = state.frames
+    record = {"event": "stage", "stage": name, **fields}
+    if frames:
+        record["parent"] = frames[-1]["stage"]
+    frame = {"stage": name, "start": 0, "peak": 0}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        # reset_peak clears the enclosing stage's peak too, so hand it over first
+        if frames:
+            frames[-1]["peak"] = max(frames[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame["start"] = frame["peak"] = current
+    frames.append(frame)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = e.__class__.__name__
+        raise
+    finally:
+        record["wall_ms"] = round((time.perf_counter() - wall_start) * 1000, 2)
+        record["cpu_ms"] = round((time.thread_time() - cpu_start) * 1000, 2)
+        frames.pop()
+        if tracing and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], frame["peak"])
+            record["peak_mb"] = round((peak - frame["start"]) / 2 ** 20, 2)
+            if frames:
+                frames[-1]["peak"] = max(frames[-1]["peak"], peak)
+        _emit(record)
+
+
+def cached(name, **fields):
+    """Record that stage ``name`` was served from a cache instead of running."""
+    record = {"event": "stage", "stage": name, "cached": True, **fields}
+    frames = _state().frames
+    if frames:
+        record["parent"] = frames[-1]["stage"]
+    _emit(record)
+
+
+@contextmanager
+def collect():
+    """Gather the records of every stage finished on this thread inside the block."""
+    records = []
+    state = _state()
+    state.collectors.append(records)
+    try:
+        yield records
+    finally:
+        state.collectors.remove(records)
+
+
+@contextmanager
+def muted():
+    """Keep stage records inside the block out of the log (collectors still see them)."""
+    state = _state()
+    state.muted += 1
+    try:
+        yield
+    finally:
+        state.muted -= 1
+
+
+@contextmanager
+def profiled(path):
+    """Run the block under cProfile and dump the stats to ``path`` (readable with ``pstats``)."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logger.info(f"Profile written to {path}")
+
+
+def summary(records):
+    """One-line summary of the top-level stages, e.g. for a status bar."""
+    parts = []
+    peak = None
+    for record in records:
+        if "parent" in record:
+            continue
+        if record.get("cached"):
+            parts.append(f"{record['stage']} cached")
+            continue
+        parts.append(f"{record['stage']} {record['wall_ms']:.0f} ms (cpu {record['cpu_ms']:.0f})")
+        if "peak_mb" in record:
+            peak = max(peak or 0, record["peak_mb"])
+    text = " · ".join(parts)
+    if peak is not None:
+        text += f" · peak {peak:.0f} MB"
+    return text
@@ -0,0 +1,143 @@
+"""
+Background job scheduling for the app.
+
+Jobs run on a thread pool and belong to a kind ("render", "ai", ...). Starting a
+job cancels the running job of the same kind, and results from superseded or
+cancelled jobs are dropped. Job functions report progress and check their
+cancellation token between chunks of work. Callbacks are delivered through a
+``dispatch`` function, which the Tk app points at ``root.after`` so they run
+on the UI thread.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("StereogramSorcery")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+
+class Job:
+    """Handle passed to a job function for progress reports and cancellation checks."""
+
+    def __init__(self, scheduler, job_id, kind, on_progress=None, on_status=None):
+        self.scheduler = scheduler
+        self.id = job_id
+        self.kind = kind
+        self.token = CancelToken()
+        self.started = time.monotonic()
+        self.on_progress = on_progress
+        self.on_status = on_status
+        self.future = None
+
+    def check(self):
+        self.token.check()
+
+    def cancel(self):
+        self.token.cancel()
+
+    def report(self, done, total):
+        """Record that ``done`` of ``total`` units are finished, then check for cancellation."""
+        self.token.check()
+        if self.on_progress is not None:
+            elapsed = time.monotonic() - self.started
+            eta = elapsed * (total - done) / done if done else None
+            self.scheduler.dispatch(lambda: self.on_progress(self, done, total, eta))
+
+    def status(self, text):
+        self.token.check()
+        if self.on_status is not None:
+            self.scheduler.dispatch(lambda: self.on_status(self, text))
+
+
+class JobScheduler:
+    def __init__(self, dispatch=None, max_workers=3):
+        self.dispatch = dispatch or (lambda callback: callback())
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sorcery-job")
+        self._ids = itertools.count(1)
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, on_done=None, on_error=None, on_progress=None, on_status=None,
+               on_finish=None):
+        """Run ``fn(job, *args)`` in the background, superseding any running job of ``kind``.
+
+        ``on_done(job, result)`` and ``on_error(job, exc)`` fire only for the
+        latest job of the kind; ``on_finish(job)`` fires for every job once it
+        stops, so callers can tidy up progress displays.
+        """
+        job = Job(self, next(self._ids), kind, on_progress, on_status)
+        with self._lock:
+            previous = self._latest.get(kind)
+            self._latest[kind] = job
+        if previous is not None:
+            previous.cancel()
+        job.future = self.executor.submit(self._run, job, fn, args, on_done, on_error, on_finish)
+        return job
+
+    def is_current(self, job):
+        with self._lock:
+            return self._latest.get(job.kind) is job and not job.token.cancelled
+
+    def active(self, kind=None):
+        with self._lock:
+            jobs = [job for k, job in self._latest.items() if kind in (None, k)]
+        return [job for job in jobs if not job.future.done() and not job.token.cancelled]
+
+    def cancel(self, kind=None):
+        with self._lock:
+            jobs = [job for k, job in self._latest.items() if kind in (None, k)]
+        for job in jobs:
+            job.cancel()
+
+    def _run(self, job, fn, args, on_done, on_error, on_finish):
+        try:
+            result = fn(job, *args)
+        except JobCancelled:
+            logger.info(f"{job.kind} job {job.id} cancelled")
+        except Exception as e:
+            logger.error(f"{job.kind} job {job.id} failed: {e}")
+            if on_error is not None and self.is_current(job):
+                self.dispatch(lambda e=e: self._deliver(job, on_error, e))
+        else:
+            if on_done is not None and self.is_current(job):
+                self.dispatch(lambda: self._deliver(job, on_done, result))
+            elif not self.is_current(job):
+                logger.info(f"Discarding stale result of {job.kind} job {job.id}")
+        finally:
+            with self._lock:
+                if self._latest.get(job.kind) is job:
+                    del self._latest[job.kind]
+            if on_finish is not None:
+                self.dispatch(lambda: on_finish(job))
+
+    def _deliver(self, job, callback, value):
+        # A newer job may have started between the worker finishing and this callback running
+        if job.token.cancelled:
+            return
+        callback(job, value)
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
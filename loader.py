@@ -0,0 +1,223 @@
+"""
+Depth map loading.
+
+``DepthSource`` opens a depth map by reading only its header. The full depth map
+is decoded the first time ``array`` is read. Display thumbnails and
+live-preview proxies come from a reduced decode where the format allows one:
+
+- JPEGs are decoded at 1/2 to 1/8 scale with ``Image.draft``.
+- ``.npy``, raw and binary PGM depth maps are memory-mapped, never read in
+  full, so a downscaled copy reads only the rows it samples.
+
+Other formats (PNG, TIFF, BMP) have no reduced decode, so their first
+thumbnail or preview decodes the full map and keeps it for the render.
+
+16-bit PNG, TIFF, PGM and array depth maps stay 16-bit until contrast
+adjustment, which quantizes them to the renderer's 8 bits (Pillow's own
+conversion to ``"L"`` clips them to white instead of scaling).
+
+Raw files carry no header, so their size comes from the file name
+(``terrain_4096x2048.raw``). They are 8-bit or little-endian 16-bit, whichever
+matches the file length.
+"""
+
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+import engine
+import instrument
+
+logger = logging.getLogger("StereogramSorcery")
+
+DEPTH_FILETYPES = ("*.png", "*.jpg", "*.jpeg", "*.bmp", "*.gif", "*.tif", "*.tiff", "*.pgm", "*.npy", "*.raw")
+# Modes Pillow opens 16-bit grayscale files in
+SIXTEEN_BIT_MODES = ("I;16", "I;16L", "I;16B", "I;16N")
+
+
+def _read_pgm_header(f):
+    """Return ``(width, height, maxval)`` from an open binary PGM, leaving ``f`` at the pixel data."""
+    if f.read(2) != b"P5":
+        return None
+    fields = []
+    while len(fields) < 3:
+        token = b""
+        c = f.read(1)
+        while c.isspace():
+            c = f.read(1)
+        while c == b"#":
+            f.readline()
+            c = f.read(1)
+            while c.isspace():
+                c = f.read(1)
+        while c and not c.isspace():
+            token += c
+            c = f.read(1)
+        fields.append(int(token))
+    return tuple(fields)
+
+
+def raw_shape(path):
+    """``(height, width, dtype)`` of a raw depth file, from the ``WxH`` in its name and its length."""
+    match = re.search(r"(\d+)x(\d+)", os.path.basename(path))
+    if not match:
+        raise ValueError(f"Raw depth map {os.path.basename(path)} needs its size in the name, e.g. depth_1920x1080.raw")
+    width, height = int(match.group(1)), int(match.group(2))
+    nbytes = os.path.getsize(path)
+    for dtype in (np.uint8, np.dtype("<u2")):
+        if nbytes == width * height * np.dtype(dtype).itemsize:
+            return height, width, dtype
+    raise ValueError(f"{os.path.basename(path)} is {nbytes} bytes, which is neither 8- nor 16-bit {width}x{height}")
+
+
+def map_depth(path):
+    """Memory-map a ``.npy``, raw or binary PGM depth map; None for formats that must be decoded."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return np.load(path, mmap_mode="r")
+    if ext == ".raw":
+        height, width, dtype = raw_shape(path)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(height, width))
+    if ext in (".pgm", ".pnm"):
+        with open(path, "rb") as f:
+            header = _read_pgm_header(f)
+            offset = f.tell()
+        if header is None:
+            return None
+        width, height, maxval = header
+        # 16-bit PGM samples are big-endian
+        dtype = np.uint8 if maxval < 256 else np.dtype(">u2")
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(height, width))
+    return None
+
+
+def depth_from_image(img):
+    """Grayscale depth array of a PIL image: uint16 for 16-bit images, otherwise uint8."""
+    if img.mode in SIXTEEN_BIT_MODES:
+        return np.asarray(img).astype(np.uint16, copy=False)
+    if img.mode == "I":
+        return np.clip(np.asarray(img), 0, 65535).astype(np.uint16)
+    return np.asarray(img.convert("L"))
+
+
+def check_depth(array):
+    if array.ndim != 2 or array.dtype.kind != "u" or array.dtype.itemsize > 2:
+        raise ValueError(f"Depth map must be a 2-D 8- or 16-bit array, got {array.dtype} with shape {array.shape}")
+    return array
+
+
+def allow_large_images():
+    """Lift Pillow's decompression bomb guard, which print-size depth maps trip.
+
+    The app and the command line call this once at startup for the local
+    files they open. Code that decodes untrusted input keeps the guard and
+    passes ``max_pixels`` to ``open_image`` instead.
+    """
+    Image.MAX_IMAGE_PIXELS = None
+
+
+@contextmanager
+def open_image(path, max_pixels=None):
+    """``Image.open`` that refuses images of more than ``max_pixels`` pixels before decoding them."""
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e)) from None
+    with img:
+        if max_pixels and img.width * img.height > max_pixels:
+            raise ValueError(f"Image is {img.width}x{img.height}, over the limit of {max_pixels} pixels")
+        yield img
+
+
+def decode_depth(path, max_pixels=None):
+    with open_image(path, max_pixels) as img:
+        return depth_from_image(img)
+
+
+def load_depth(path):
+    """Depth array of ``path``: memory-mapped when the format allows, decoded otherwise."""
+    array = map_depth(path)
+    if array is None:
+        array = decode_depth(path)
+    return check_depth(array)
+
+
+def display_image(depth):
+    """8-bit grayscale image of a depth array, for showing on screen."""
+    depth = np.asarray(depth)
+    if depth.dtype.itemsize == 2:
+        depth = (depth >> 8).astype(np.uint8)
+    return Image.fromarray(depth, "L")
+
+
+class DepthSource:
+    """A depth map whose full-resolution array is decoded on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.format = None
+        self._array = None
+        self._lock = threading.Lock()
+        mapped = map_depth(path)
+        if mapped is not None:
+            self._array = check_depth(mapped)
+            self.size = (mapped.shape[1], mapped.shape[0])
+        else:
+            with open_image(path) as img:
+                self.format = img.format
+                self.size = img.size
+
+    @classmethod
+    def from_array(cls, array, name=""):
+        source = cls.__new__(cls)
+        source.path = None
+        source.name = name
+        source.format = None
+        source._array = check_depth(np.asarray(array))
+        source._lock = threading.Lock()
+        source.size = (source._array.shape[1], source._array.shape[0])
+        return source
+
+    @property
+    def loaded(self):
+        return self._array is not None
+
+    @property
+    def array(self):
+        """The full-resolution depth array, decoded on first access."""
+        with self._lock:
+            if self._array is None:
+                with instrument.stage("decode_depth", format=self.format, width=self.size[0], height=self.size[1]):
+                    self._array = check_depth(decode_depth(self.path))
+            return self._array
+
+    def preview(self, size):
+        """Depth array scaled to ``size`` (width, height), decoding no more than it needs to.
+
+        Formats without a reduced decode are decoded in full here, and the
+        array is kept for ``array``.
+        """
+        if self._array is None and self.format == "JPEG":
+            with open_image(self.path) as img:
+                # The JPEG decoder skips DCT detail it would throw away, at a scale no smaller than size
+                img.draft("L", size)
+                depth = depth_from_image(img)
+        else:
+            depth = self.array
+            if isinstance(depth, np.memmap):
+                # Sample every step-th row and column first so only those pages are read
+                step = max(min(depth.shape[1] // size[0], depth.shape[0] // size[1]) // 2, 1)
+                depth = np.ascontiguousarray(depth[::step, ::step])
+        if (depth.shape[1], depth.shape[0]) == tuple(size):
+            return np.ascontiguousarray(depth)
+        return engine.downscale_depth(depth, size)
+
+    def thumbnail(self, bounds):
+        """8-bit image of the depth map fitted inside ``bounds``, never upscaled."""
+        return display_image(self.preview(engine.preview_size(self.size, bounds)))
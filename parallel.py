@@ -0,0 +1,130 @@
+"""
+Multi-core stereogram rendering.
+
+Each stereogram row depends only on its own depth and pattern rows, so the
+image is split into horizontal bands rendered by a process pool. Depth,
+pattern and output buffers live in ``multiprocessing.shared_memory`` blocks;
+workers only receive block names and band bounds, never pickled arrays.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import backends
+
+# Bands per worker; a few extra bands even out rows that render slower
+BANDS_PER_WORKER = 4
+MIN_BAND_ROWS = 16
+
+
+def _render_band(spec, y0, y1):
+    # Pool workers share the parent's resource tracker, so attaching here only
+    # repeats the parent's registration and the parent stays in charge of unlinking
+    blocks = [shared_memory.SharedMemory(name=spec[key]) for key in ("depth", "pattern", "output")]
+    try:
+        height, width = spec["shape"]
+        depth = np.ndarray((height, width), dtype=np.uint8, buffer=blocks[0].buf)
+        pattern = np.ndarray((height, width, 3), dtype=np.uint8, buffer=blocks[1].buf)
+        output = np.ndarray((height, width, 3), dtype=np.uint8, buffer=blocks[2].buf)
+        render = backends.get(spec["backend"], spec["mode"])
+        output[y0:y1] = render(depth[y0:y1], pattern[y0:y1], spec["shift_strength"])
+        del depth, pattern, output
+    finally:
+        for block in blocks:
+            block.close()
+    return y1 - y0
+
+
+def _pool_context():
+    # Forking a process that runs a Tk main loop and render threads is fragile
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def split_bands(height, bands, min_rows=MIN_BAND_ROWS):
+    bands = max(1, min(bands, -(-height // max(min_rows, 1))))
+    bounds = np.linspace(0, height, bands + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+class ParallelRenderer:
+    """A reusable process pool for row-band rendering.
+
+    Keep one around for repeated renders to avoid paying process start-up on
+    every call; use it as a context manager or call ``close()`` when done.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or default_workers())
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+
+    def render(self, depth_enhanced, pattern_array, shift_strength, progress=None, backend=None, mode=None,
+               band_rows=None):
+        """Render across the pool; ``progress(rows_done, height)`` follows ``engine.render_rows``.
+
+        ``backend`` and ``mode`` are names from ``backends.py``; each worker loads the kernel once.
+        ``band_rows`` caps the rows in one band, e.g. from ``backends.band_rows``.
+        """
+        height, width = depth_enhanced.shape[:2]
+        if pattern_array.shape[:2] != (height, width):
+            raise ValueError(f"Pattern shape {pattern_array.shape[:2]} does not match depth shape {(height, width)}")
+        blocks = {}
+        try:
+            for key, size in (("depth", height * width), ("pattern", height * width * 3), ("output", height * width * 3)):
+                blocks[key] = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            np.ndarray((height, width), dtype=np.uint8, buffer=blocks["depth"].buf)[:] = depth_enhanced
+            np.ndarray((height, width, 3), dtype=np.uint8, buffer=blocks["pattern"].buf)[:] = pattern_array
+            spec = {key: block.name for key, block in blocks.items()}
+            spec["shape"] = (height, width)
+            spec["shift_strength"] = int(shift_strength)
+            spec["backend"] = backend or backends.DEFAULT_BACKEND
+            spec["mode"] = mode or backends.DEFAULT_MODE
+            if band_rows:
+                bands = split_bands(height, max(self.workers * BANDS_PER_WORKER, -(-height // band_rows)),
+                                    min(band_rows, MIN_BAND_ROWS))
+            else:
+                bands = split_bands(height, self.workers * BANDS_PER_WORKER)
+            futures = [self.pool.submit(_render_band, spec, y0, y1) for y0, y1 in bands]
+            rows_done = 0
+            try:
+                for future in as_completed(futures):
+                    rows_done += future.result()
+                    if progress is not None:
+                        progress(rows_done, height)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            output = np.ndarray((height, width, 3), dtype=np.uint8, buffer=blocks["output"].buf)
+            result = output.copy()
+            del output
+            return result
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def render_parallel(depth_enhanced, pattern_array, shift_strength, workers=None, backend=None, mode=None,
+                    band_rows=None):
+    """One-off parallel render; prefer a long-lived ``ParallelRenderer`` for batches."""
+    with ParallelRenderer(workers) as renderer:
+        return renderer.render(depth_enhanced, pattern_array, shift_strength, backend=backend, mode=mode,
+                               band_rows=band_rows)
@@ -0,0 +1,165 @@
+"""
+Memoized render pipeline.
+
+The pipeline is a small graph of stages: depth contrast, pattern scaling and
+tiling, the stereogram render, and message embedding. Each stage's output is
+cached under a key built from its own inputs (content hashes for the depth map
+and pattern, plus the parameters that stage uses), so nudging one setting only
+recomputes the stages downstream of it. All stages share one LRU with a byte
+budget. Every stage run, or cache hit, is recorded through ``instrument``.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import backends
+import engine
+import instrument
+import stego
+
+DEFAULT_CACHE_BYTES = 768 * 1024 * 1024
+STAGES = ("contrast", "pattern", "render", "stego")
+
+# Everything one render needs, captured up front so background jobs never read UI state
+RenderParams = namedtuple("RenderParams", [
+    "depth_source", "pattern_img", "shift_strength", "pattern_scale", "contrast", "message", "workers", "backend",
+    "mode", "memory_budget",
+], defaults=(None, None, None))
+
+
+def _tile_pattern(pattern_img, size, pattern_scale):
+    with instrument.stage("pattern_resize"):
+        tile = engine.scale_pattern(pattern_img, pattern_scale)
+    with instrument.stage("tile"):
+        return engine.tile_array(tile, size)
+
+
+class StageCache:
+    """LRU cache of arrays bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if value.nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key).nbytes
+        self._entries[key] = value
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class RenderGraph:
+    """Runs the stereogram pipeline, skipping stages whose inputs have not changed.
+
+    ``stats()`` reports per-stage hit and miss counts so callers can confirm
+    which stages were reused. Safe to share between threads; stage work runs
+    outside the lock.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.cache = StageCache(max_bytes)
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {stage: {"hits": 0, "misses": 0} for stage in STAGES}
+
+    def stats(self):
+        with self._lock:
+            return {stage: dict(counts) for stage, counts in self._stats.items()}
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self._digests.clear()
+
+    def digest(self, source):
+        """Content hash of a depth array or pattern image, remembered per object."""
+        with self._lock:
+            entry = self._digests.get(id(source))
+        # The entry keeps the object alive so its id cannot be reused while remembered
+        if entry is not None and entry[0] is source:
+            return entry[1]
+        h = hashlib.blake2b(digest_size=16)
+        if isinstance(source, np.ndarray):
+            h.update(f"{source.dtype}{source.shape}".encode())
+            h.update(np.ascontiguousarray(source).data)
+        else:
+            h.update(f"{source.mode}{source.size}".encode())
+            h.update(source.tobytes())
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[id(source)] = (source, digest)
+            while len(self._digests) > 8:
+                self._digests.popitem(last=False)
+        return digest
+
+    def _stage(self, stage, key, compute):
+        cache_key = (stage,) + key
+        with self._lock:
+            value = self.cache.get(cache_key)
+            self._stats[stage]["hits" if value is not None else "misses"] += 1
+        if value is not None:
+            instrument.cached(stage)
+            return value
+        with instrument.stage(stage):
+            value = compute()
+        value.flags.writeable = False
+        with self._lock:
+            self.cache.put(cache_key, value)
+        return value
+
+    def render(self, depth_array, pattern_img, shift_strength, pattern_scale=engine.DEFAULT_PATTERN_SCALE,
+               contrast=engine.DEFAULT_CONTRAST, message=None, renderer=None, mode=None, memory_budget=None):
+        """Return the stereogram as a read-only RGB array.
+
+        ``mode`` is a render mode from ``backends.py``. ``renderer`` replaces
+        that mode's default backend for the render stage, e.g. another backend
+        or a ``ParallelRenderer.render``; it must produce the same pixels, which
+        is why only the mode is part of the cache key. ``memory_budget``
+        (bytes) renders the default backend in row bands that fit it; a custom
+        ``renderer`` does its own banding. Cached stages do not count against it.
+        """
+        mode = mode or backends.DEFAULT_MODE
+        engine.check_shift_strength(shift_strength)
+        height, width = depth_array.shape[:2]
+        if renderer is None and memory_budget:
+            chunk_rows = backends.band_rows(memory_budget, (width, height), mode=mode)
+            renderer = lambda depth, pattern, shift: engine.render_rows(
+                depth, pattern, shift, chunk_rows=chunk_rows, render=backends.get(None, mode))
+        renderer = renderer or backends.get(None, mode)
+        contrast_key = (self.digest(depth_array), float(contrast))
+        pattern_key = (self.digest(pattern_img), float(pattern_scale), width, height)
+        render_key = contrast_key + pattern_key + (int(shift_strength), mode)
+
+        depth_enhanced = self._stage("contrast", contrast_key,
+                                     lambda: engine.adjust_contrast(depth_array, contrast))
+        pattern_array = self._stage("pattern", pattern_key,
+                                    lambda: _tile_pattern(pattern_img, (width, height), pattern_scale))
+        result = self._stage("render", render_key,
+                             lambda: renderer(depth_enhanced, pattern_array, shift_strength))
+        if not message:
+            return result
+        return self._stage("stego", render_key + (message,),
+                           lambda: stego.embed_message_array(result.copy(), message))
@@ -0,0 +1,178 @@
+"""
+Bulk hidden-message scanner.
+
+Walks directories of PNG/BMP stereograms and reports which ones carry an LSB
+payload. Only the top rows that hold the length header (and then the payload)
+are decoded, each of them once, files are spread over a process pool, and
+results are written as JSON lines as soon as each file is done. Pillow's
+decompression bomb guard stays on, and no decode may exceed ``max_pixels``.
+"""
+
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+import loader
+import stego
+import streaming
+
+logger = logging.getLogger("StereogramSorcery")
+
+IMAGE_EXTENSIONS = (".png", ".bmp")
+# Archive files are untrusted, so no image is decoded past this many pixels
+DEFAULT_MAX_PIXELS = 100 * 10 ** 6
+
+
+def iter_images(paths, extensions=IMAGE_EXTENSIONS):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(extensions):
+                    yield os.path.join(dirpath, name)
+
+
+def _rgb(img):
+    return np.asarray(img if img.mode == "RGB" else img.convert("RGB"))
+
+
+class TopRows:
+    """The top rows of an image as an RGB array, decoded only as far as asked and never twice.
+
+    Non-interlaced PNGs are inflated row by row (``streaming.PNGRows``) and
+    uncompressed BMPs read just the new rows. Anything else, or a BMP whose
+    partial read fails, is decoded once in full. No decode covers more than
+    ``max_pixels`` pixels.
+    """
+
+    def __init__(self, path, max_pixels=DEFAULT_MAX_PIXELS):
+        self.path = path
+        self.max_pixels = max_pixels
+        with loader.open_image(path) as img:
+            self.width, self.height = img.size
+            self.format = img.format
+        self.pixels = np.empty((0, self.width, 3), dtype=np.uint8)
+        self._png = None
+        if self.format == "PNG":
+            rows = streaming.PNGRows(path, convert=_rgb)
+            if rows.streamable:
+                self._png = rows
+            else:
+                rows.close()
+
+    def bits(self, nbits):
+        """First ``nbits`` LSBs in embedding order; a ``read_bits`` for ``stego.read_payload``."""
+        rows = min(-(-nbits // (self.width * 3)), self.height)
+        if rows > len(self.pixels):
+            self._extend(rows)
+        return self.pixels.reshape(-1)[:nbits] & 1
+
+    def _extend(self, rows):
+        if self.max_pixels and self.width * rows > self.max_pixels:
+            raise ValueError(f"Reading {rows} rows of {self.path} would decode over {self.max_pixels} pixels")
+        y0 = len(self.pixels)
+        if self._png is not None:
+            new = self._png.read(y0, rows)
+        elif self.format == "BMP":
+            new = self._bmp_rows(y0, rows)
+        else:
+            new = None
+        if new is None:
+            with loader.open_image(self.path, self.max_pixels) as img:
+                self.pixels = _rgb(img)
+            return
+        self.pixels = np.concatenate([self.pixels, new])
+
+    def _bmp_rows(self, y0, y1):
+        """Rows ``y0:y1`` of an uncompressed BMP, or None when it has to be decoded in full.
+
+        This points Pillow's tile (and its private ``_size``) at just those
+        rows, so it only runs when they have the shape it expects.
+        """
+        try:
+            with Image.open(self.path) as img:
+                if len(img.tile) != 1 or not isinstance(getattr(img, "_size", None), tuple):
+                    return None
+                codec, extents, offset, args = img.tile[0]
+                if codec != "raw" or not isinstance(args, tuple) or len(args) != 3:
+                    return None
+                rawmode, stride, orientation = args
+                # Bottom-up rows: the top of the image is at the end of the pixel data
+                offset += (self.height - y1) * stride if orientation < 0 else y0 * stride
+                img.tile = [(codec, (0, 0, self.width, y1 - y0), offset, args)]
+                img._size = (self.width, y1 - y0)
+                img.load()
+                if img.size != (self.width, y1 - y0):
+                    return None
+                return _rgb(img)
+        except Exception as e:
+            logger.debug(f"Partial decode of {self.path} failed ({type(e).__name__}: {e}); decoding it fully")
+            return None
+
+    def close(self):
+        if self._png is not None:
+            self._png.close()
+
+
+def scan_file(path, max_pixels=DEFAULT_MAX_PIXELS):
+    record = {"path": path, "has_message": False, "length": None, "message": None, "error": None}
+    reader = None
+    try:
+        reader = TopRows(path, max_pixels)
+        message_bytes = stego.read_payload(reader.bits, reader.width * reader.height * 3)
+        if not message_bytes:
+            # Messages are never empty, so a zero header is just dark pixels (an all-black image, say)
+            return record
+        record["length"] = len(message_bytes)
+        record["message"] = message_bytes.decode("utf-8")
+        record["has_message"] = True
+    except UnicodeDecodeError:
+        record["error"] = "Invalid UTF-8 data"
+    except ValueError as e:
+        if str(e) != "No hidden message found":
+            record["error"] = str(e)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if reader is not None:
+            reader.close()
+    return record
+
+
+def scan(paths, output=None, workers=None, extensions=IMAGE_EXTENSIONS, max_pixels=DEFAULT_MAX_PIXELS):
+    """Scan ``paths`` and write one JSON line per image to ``output`` (stdout by default).
+
+    Returns the number of files scanned and how many carried a message.
+    """
+    output = output or sys.stdout
+    files = iter_images(paths, extensions)
+    workers = workers or os.cpu_count() or 1
+    scanned = found = 0
+    scan_one = functools.partial(scan_file, max_pixels=max_pixels)
+    if workers == 1:
+        results = map(scan_one, files)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(scan_one, files, chunksize=16)
+    try:
+        for record in results:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            scanned += 1
+            found += record["has_message"]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    logger.info(f"Scanned {scanned} images, {found} with hidden messages")
+    return scanned, found
@@ -0,0 +1,406 @@
+"""
+Local HTTP render service.
+
+Runs the render pipeline behind a small HTTP API so other services can make
+stereograms without the app:
+
+    python -m sorcery serve --port 8765 --workers 4
+
+``POST /render`` takes a JSON object with the depth map and pattern as
+base64-encoded image files (or a ``.npy`` depth array), plus the render
+parameters, and answers with the encoded stereogram:
+
+    {"depth": "<base64>", "pattern": "<base64>", "shift_strength": 20,
+     "pattern_scale": 1.0, "contrast": 0.03, "message": "hello", "format": "png"}
+
+Renders run on a bounded process pool. Requests identical to one already in
+flight (same content hashes and parameters) wait for that render rather than
+starting another. When the accepted renders reach the queue limit, new ones
+are turned away with ``503`` and a ``Retry-After`` header instead of queuing
+without bound. ``GET /metrics`` reports queue depth, counters and latency
+percentiles as JSON.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+
+import engine
+import export
+import instrument
+import loader
+import parallel
+import stego
+
+logger = logging.getLogger("StereogramSorcery")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Accepted renders allowed to wait per worker before requests are turned away
+QUEUE_PER_WORKER = 2
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_MAX_BODY = 256 * 2 ** 20
+# Largest depth map or pattern decoded, checked from the header before any pixels are read
+DEFAULT_MAX_PIXELS = 100 * 10 ** 6
+LATENCY_WINDOW = 1000
+RETRY_AFTER_SECONDS = 1
+CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+NPY_MAGIC = b"\x93NUMPY"
+
+# Render parameters a request may set, with their types and defaults
+PARAMETERS = {
+    "shift_strength": (int, engine.DEFAULT_SHIFT_STRENGTH),
+    "pattern_scale": (float, engine.DEFAULT_PATTERN_SCALE),
+    "contrast": (float, engine.DEFAULT_CONTRAST),
+    "message": (str, None),
+    "format": (str, "png"),
+    "quality": (int, export.DEFAULT_JPEG_QUALITY),
+    "compress_level": (int, export.DEFAULT_COMPRESS_LEVEL),
+    "mode": (str, None),
+    "backend": (str, None),
+    "memory_budget": (int, None),
+}
+# Inclusive ranges of the numeric parameters; None leaves that end open
+LIMITS = {
+    "shift_strength": (0, None),
+    "pattern_scale": (0.01, 10.0),
+    "quality": (1, 100),
+    "compress_level": (0, 9),
+    "memory_budget": (1, None),
+}
+
+
+class ServiceBusy(Exception):
+    """The render queue is full."""
+
+
+def parse_request(body):
+    """Split a ``/render`` JSON body into depth bytes, pattern bytes and validated parameters."""
+    try:
+        request = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Request body is not valid JSON: {e}") from None
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object")
+    files = []
+    for name in ("depth", "pattern"):
+        if not isinstance(request.get(name), str):
+            raise ValueError(f"Missing {name!r}: a base64-encoded image file")
+        try:
+            files.append(base64.b64decode(request[name], validate=True))
+        except (binascii.Error, ValueError):
+            raise ValueError(f"{name!r} is not valid base64") from None
+    unknown = set(request) - set(PARAMETERS) - {"depth", "pattern"}
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    params = {}
+    for name, (kind, default) in PARAMETERS.items():
+        value = request.get(name, default)
+        if value is not None:
+            if kind is float and isinstance(value, int) and not isinstance(value, bool):
+                value = float(value)
+            if not isinstance(value, kind) or isinstance(value, bool):
+                raise ValueError(f"{name!r} must be {kind.__name__}")
+            low, high = LIMITS.get(name, (None, None))
+            if (low is not None and value < low) or (high is not None and value > high):
+                bounds = f"at least {low}" if high is None else f"between {low} and {high}"
+                raise ValueError(f"{name!r} must be {bounds}, not {value}")
+        params[name] = value
+    if params["format"] not in CONTENT_TYPES:
+        raise ValueError(f"Unknown format {params['format']!r}; choose from {', '.join(CONTENT_TYPES)}")
+    return files[0], files[1], params
+
+
+def request_key(depth_data, pattern_data, params):
+    """Content hashes of both inputs plus every parameter; equal keys render equal images."""
+    h = hashlib.blake2b(digest_size=16)
+    for data in (depth_data, pattern_data):
+        h.update(hashlib.blake2b(data, digest_size=16).digest())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def decode_depth(data, max_pixels=DEFAULT_MAX_PIXELS):
+    f = BytesIO(data)
+    if data[:len(NPY_MAGIC)] != NPY_MAGIC:
+        return loader.check_depth(loader.decode_depth(f, max_pixels))
+    # np.load allocates the shape its header declares before reading, so check that first
+    version = np.lib.format.read_magic(f)
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape = read_header(f)[0]
+    if int(np.prod(shape, dtype=np.int64)) > max_pixels:
+        raise ValueError(f"Depth array of shape {shape} is over the limit of {max_pixels} pixels")
+    f.seek(0)
+    return loader.check_depth(np.load(f, allow_pickle=False))
+
+
+def render_request(depth_data, pattern_data, params, max_pixels=DEFAULT_MAX_PIXELS):
+    """Render and encode one request; runs in a pool worker."""
+    from PIL import Image
+    with instrument.collect() as records:
+        with instrument.stage("decode"):
+            depth_array = decode_depth(depth_data, max_pixels)
+            with loader.open_image(BytesIO(pattern_data), max_pixels) as img:
+                # The scaled tile is allocated in full, so it counts against the limit too
+                scaled = int(img.width * params["pattern_scale"]) * int(img.height * params["pattern_scale"])
+                if scaled > max_pixels:
+                    raise ValueError(f"Pattern scaled by {params['pattern_scale']} is {scaled} pixels, "
+                                     f"over the limit of {max_pixels}")
+                pattern_img = img.convert("RGB")
+        result_img = engine.create_stereogram(
+            depth_array, pattern_img,
+            shift_strength=params["shift_strength"],
+            pattern_scale=params["pattern_scale"],
+            contrast=params["contrast"],
+            message=params["message"],
+            backend=params["backend"],
+            mode=params["mode"],
+            memory_budget=params["memory_budget"],
+        )
+        fmt = params["format"]
+        with instrument.stage("encode", format=fmt):
+            data = export.encode(result_img, fmt, export.encoder_options(fmt, params["compress_level"],
+                                                                          params["quality"]))
+        payload = None
+        if params["message"]:
+            with Image.open(BytesIO(data)) as decoded:
+                payload = stego.extract_message(decoded) == params["message"]
+    return {
+        "data": data,
+        "content_type": CONTENT_TYPES[fmt],
+        "payload": payload,
+        "render_ms": round(sum(record["wall_ms"] for record in records if "parent" not in record), 2),
+        "stages": instrument.summary(records),
+    }
+
+
+def _warm():
+    # Unpickling this call imports the service module, and the render modules with it
+    return None
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 2)
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 2)}
+
+
+class RenderService:
+    """A bounded render pool that coalesces identical in-flight requests.
+
+    At most ``workers`` renders run at once and ``queue_size`` more wait;
+    ``render`` raises ``ServiceBusy`` rather than accept a render past that.
+    If a worker process dies, the renders it took down fail and the pool is
+    replaced, so later requests are unaffected.
+    """
+
+    def __init__(self, workers=None, queue_size=None, timeout=DEFAULT_TIMEOUT, max_pixels=DEFAULT_MAX_PIXELS):
+        self.workers = max(1, workers or parallel.default_workers())
+        self.queue_size = self.workers * QUEUE_PER_WORKER if queue_size is None else max(queue_size, 0)
+        self.timeout = timeout
+        self.max_pixels = max_pixels
+        self.pool = self._new_pool()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._waiting = 0
+        self._counts = {"requests": 0, "rendered": 0, "coalesced": 0, "rejected": 0, "failed": 0, "restarts": 0}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._render_times = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=parallel._pool_context())
+
+    def _restart(self, broken):
+        """Replace ``broken`` with a fresh pool, unless another thread already did; call with the lock held."""
+        if self.pool is not broken:
+            return
+        self.pool = self._new_pool()
+        self._counts["restarts"] += 1
+        logger.error("A render worker died; restarted the worker pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self):
+        """Start every worker process now instead of on the first requests."""
+        for future in [self.pool.submit(_warm) for _ in range(self.workers)]:
+            future.result()
+
+    def _submit(self, key, depth_data, pattern_data, params):
+        with self._lock:
+            self._counts["requests"] += 1
+            entry = self._inflight.get(key)
+            if entry is not None:
+                self._counts["coalesced"] += 1
+                return entry + (True,)
+            if len(self._inflight) >= self.workers + self.queue_size:
+                self._counts["rejected"] += 1
+                raise ServiceBusy(f"{len(self._inflight)} renders already accepted")
+            try:
+                future = self.pool.submit(render_request, depth_data, pattern_data, params, self.max_pixels)
+            except BrokenProcessPool:
+                # The pool broke after its last render finished; this request has not run yet
+                self._restart(self.pool)
+                future = self.pool.submit(render_request, depth_data, pattern_data, params, self.max_pixels)
+            pool = self.pool
+            self._inflight[key] = (future, pool)
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future, pool, False
+
+    def _finished(self, key, future):
+        with self._lock:
+            if self._inflight.get(key, (None,))[0] is future:
+                del self._inflight[key]
+            if future.cancelled() or future.exception() is not None:
+                self._counts["failed"] += 1
+            else:
+                self._counts["rendered"] += 1
+                self._render_times.append(future.result()["render_ms"])
+
+    def render(self, depth_data, pattern_data, params):
+        """Return ``(result, coalesced)`` for one request; see ``render_request`` for the result."""
+        start = time.perf_counter()
+        future, pool, coalesced = self._submit(request_key(depth_data, pattern_data, params),
+                                               depth_data, pattern_data, params)
+        with self._lock:
+            self._waiting += 1
+        try:
+            result = future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # Only the renders that were on the dead pool fail; the next request gets a fresh one
+            with self._lock:
+                self._restart(pool)
+            raise
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            self._latencies.append((time.perf_counter() - start) * 1000)
+        return result, coalesced
+
+    def metrics(self):
+        with self._lock:
+            pending = len(self._inflight)
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_size,
+                "in_flight": pending,
+                "queue_depth": max(pending - self.workers, 0),
+                "waiting_requests": self._waiting,
+                **self._counts,
+                "latency_ms": percentiles(self._latencies),
+                "render_ms": percentiles(self._render_times),
+                "uptime_s": round(time.time() - self.started, 1),
+            }
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = "StereogramSorcery"
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, value, headers=()):
+        self._send(status, json.dumps(value).encode(), headers=headers)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"No such endpoint: {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/render":
+            self._send_json(404, {"error": f"No such endpoint: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            self._send_json(400, {"error": "Content-Length must be a non-negative integer"})
+            self.close_connection = True
+            return
+        if length > self.server.max_body:
+            self._send_json(413, {"error": f"Request body over {self.server.max_body} bytes"})
+            self.close_connection = True
+            return
+        service = self.server.service
+        try:
+            depth_data, pattern_data, params = parse_request(self.rfile.read(length))
+            with instrument.stage("serve", format=params["format"]) as record:
+                result, coalesced = service.render(depth_data, pattern_data, params)
+                record["coalesced"] = coalesced
+        except ServiceBusy as e:
+            self._send_json(503, {"error": f"Render queue full: {e}"},
+                            headers=[("Retry-After", str(RETRY_AFTER_SECONDS))])
+            return
+        except FutureTimeout:
+            self._send_json(504, {"error": f"Render did not finish within {service.timeout:.0f} s"})
+            return
+        except BrokenProcessPool:
+            self._send_json(500, {"error": "The render worker died; the worker pool has been restarted"})
+            return
+        except (ValueError, OSError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            logger.error(f"Render request failed: {e}")
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        headers = [("X-Render-Ms", str(result["render_ms"])), ("X-Coalesced", "1" if coalesced else "0")]
+        if result["payload"] is not None:
+            headers.append(("X-Payload", "kept" if result["payload"] else "lost"))
+        self._send(200, result["data"], result["content_type"], headers)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, service=None, max_body=DEFAULT_MAX_BODY):
+    """An HTTP server bound to ``host:port`` that renders through ``service`` (a new ``RenderService`` by default)."""
+    server = ThreadingHTTPServer((host, port), RenderHandler)
+    server.daemon_threads = True
+    server.service = service or RenderService()
+    server.max_body = max_body
+    return server
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, queue_size=None, timeout=DEFAULT_TIMEOUT,
+          max_body=DEFAULT_MAX_BODY, max_pixels=DEFAULT_MAX_PIXELS):
+    service = RenderService(workers, queue_size, timeout, max_pixels)
+    server = make_server(host, port, service, max_body)
+    try:
+        service.warm()
+        logger.info(f"Serving renders on http://{host}:{server.server_address[1]} with {service.workers} workers "
+                    f"and room for {service.queue_size} queued")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
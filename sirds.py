@@ -0,0 +1,190 @@
+"""
+Constraint-linking stereogram render mode.
+
+The classic algorithm of Thimbleby, Inglis and Witten ("Displaying 3D images:
+algorithms for single-image random-dot stereograms", 1994). For every pixel
+the depth fixes a separation between the two image points the eyes fuse
+there; those two points are constrained to share a colour, recorded as a link
+from the left point to the right one. Links are kept symmetric about the
+pixel (so depth edges do not smear to one side), points that one eye cannot
+see past a nearer surface are left unlinked (hidden-surface removal), and a
+final right-to-left pass gives every pixel the colour of the pixel it is
+linked to, or the pattern's colour when it is free.
+
+The link table is a plain integer array, and each step of the left-to-right
+sweep updates one column for all rows at once, so a row costs O(width) vector
+steps rather than Python objects per pixel.
+"""
+
+import numpy as np
+
+import engine
+
+# Depth of field: the fraction of the viewing distance the depth range spans
+DEFAULT_DEPTH_OF_FIELD = 1.0 / 3.0
+
+
+def eye_separation(shift_strength, mu=DEFAULT_DEPTH_OF_FIELD):
+    """Eye separation in pixels for which near and far differ by ``shift_strength`` pixels.
+
+    Keeps the ``shift_strength`` slider meaningful in this mode: it is the
+    difference between the furthest and nearest separations.
+    """
+    return max(shift_strength, 1) * 2 * (2 - mu) / mu
+
+
+def depth_tables(eye, mu=DEFAULT_DEPTH_OF_FIELD):
+    """Per 8-bit depth level: depth scaled to 0..1 (white is near), the separation
+    of the two image points fused there, and how fast the line of sight rises
+    per pixel away from the point (for hidden-surface removal)."""
+    z = np.arange(256, dtype=np.float32) / 255.0
+    separation = np.rint((1 - mu * z) * eye / (2 - mu * z)).astype(np.int32)
+    step = 2 * (2 - mu * z) / (mu * eye)
+    return z, separation, step
+
+
+def separations(depth, eye, mu=DEFAULT_DEPTH_OF_FIELD):
+    """Scaled depth, separation and line-of-sight step for every pixel of an 8-bit depth map."""
+    depth = np.asarray(depth, dtype=np.uint8)
+    return tuple(engine.lookup(table, depth) for table in depth_tables(eye, mu))
+
+
+def _visible(z, step):
+    """Hidden-surface removal: False where something nearer blocks either eye's view."""
+    height, width = z.shape
+    visible = np.ones_like(z, dtype=bool)
+    zt = np.empty_like(z)
+    blocked = np.empty_like(visible)
+    checking = np.ones_like(visible)
+    # zt reaches 1 by t = mu * eye / 4 at the latest, so this ends long before width
+    for t in range(1, width + 1):
+        np.multiply(step, t, out=zt)
+        zt += z
+        blocked[:] = False
+        np.greater_equal(z[:, :-t], zt[:, t:], out=blocked[:, t:])
+        blocked[:, :-t] |= z[:, t:] >= zt[:, :-t]
+        blocked &= checking
+        visible &= ~blocked
+        # The published loop tests the first zt >= 1 too, then stops
+        checking &= visible
+        checking &= zt < 1
+        if not checking.any():
+            break
+    return visible
+
+
+def link_table(depth, shift_strength, mu=DEFAULT_DEPTH_OF_FIELD, eye=None):
+    """Return ``same``: for every pixel, the column it must share a colour with (itself if free).
+
+    The table is column-major, shape ``(width, height)``, so each step of the
+    sweep touches contiguous memory.
+    """
+    height, width = depth.shape[:2]
+    eye = eye or eye_separation(shift_strength, mu)
+    z, sep, step = separations(depth, eye, mu)
+    index_dtype = np.int32 if (width + 1) * height < 2 ** 31 - 1 else np.int64
+    rows = np.arange(height, dtype=index_dtype)
+    cols = np.arange(width, dtype=index_dtype)
+    # Odd separations alternate their extra pixel to avoid a one-sided bias. The
+    # paper alternates by row; alternating by column keeps every row independent
+    # of its position, so bands and strips render the same as the whole image
+    left_all = cols[None, :] - (sep + (sep & cols[None, :].astype(np.int32) & 1)) // 2
+    right_all = left_all + sep
+    candidate = (left_all >= 0) & (right_all < width) & _visible(z, step)
+    del z, sep, step
+    # Pixels without a constraint point both ends at a sentinel column that always
+    # links to itself, so every row can go through the same vector steps
+    left_t = np.ascontiguousarray(np.where(candidate, left_all, width).T.astype(index_dtype))
+    right_t = np.ascontiguousarray(np.where(candidate, right_all, width).T.astype(index_dtype))
+    del left_all, right_all, candidate
+
+    same = np.repeat(np.arange(width + 1, dtype=index_dtype), height).reshape(width + 1, height)
+    flat = same.reshape(-1)
+    for x in range(width):
+        left = left_t[x]
+        right = right_t[x]
+        linked = flat.take(left * height + rows)
+        pending = np.flatnonzero((linked != left) & (linked != right))
+        # Follow existing links until this pair's constraint can be recorded;
+        # only the rows still walking are carried through each step
+        l, r, k, y = left[pending], right[pending], linked[pending], rows[pending]
+        while pending.size:
+            split = k > r
+            # linked > right: re-link left to right, then carry on from right
+            flat[l[split] * height + y[split]] = r[split]
+            l = np.where(split, r, k)
+            k = flat.take(l * height + y)
+            r = np.where(split, k, r)
+            walking = (k != l) & (k != r)
+            if not walking.all():
+                done = ~walking
+                left[pending[done]] = l[done]
+                right[pending[done]] = r[done]
+                pending, l, r, k, y = pending[walking], l[walking], r[walking], k[walking], y[walking]
+        flat[left * height + rows] = right
+    return same[:width]
+
+
+def render_linked(depth_enhanced, pattern_array, shift_strength, mu=DEFAULT_DEPTH_OF_FIELD, eye=None):
+    """Render a constraint-linked stereogram with the same inputs as ``engine.render_stereogram``.
+
+    Free pixels take the colour of ``pattern_array`` at their own position.
+    """
+    height, width = depth_enhanced.shape[:2]
+    same_t = link_table(depth_enhanced, shift_strength, mu, eye)
+    # source: the pattern pixel each pixel ends up showing, resolved right to left
+    # in column-major order so every step is a contiguous read and write
+    index_dtype = np.int32 if height * width < 2 ** 31 - 1 else np.int64
+    rows = np.arange(height, dtype=index_dtype)
+    source = np.arange(height * width, dtype=index_dtype).reshape(height, width).T.copy()
+    flat = source.reshape(-1)
+    for x in range(width - 1, -1, -1):
+        links = same_t[x]
+        linked = links != x
+        if linked.any():
+            source[x] = np.where(linked, flat.take(links.astype(index_dtype) * height + rows), source[x])
+    return engine.gather_pixels(pattern_array, source)
+
+
+def render_linked_reference(depth_enhanced, pattern_array, shift_strength, mu=DEFAULT_DEPTH_OF_FIELD, eye=None):
+    """Scalar transcription of the published algorithm, row by row; the ground truth for ``render_linked``.
+
+    Like the vectorized version it alternates odd separations by column rather than by row.
+    """
+    height, width = depth_enhanced.shape[:2]
+    eye = eye or eye_separation(shift_strength, mu)
+    z_all, sep_all, step_all = separations(depth_enhanced, eye, mu)
+    result = np.zeros((height, width, 3), dtype=np.uint8)
+    for y in range(height):
+        z = z_all[y]
+        same = list(range(width))
+        for x in range(width):
+            s = int(sep_all[y, x])
+            left = x - (s + (s & x & 1)) // 2
+            right = left + s
+            if left < 0 or right >= width:
+                continue
+            step = step_all[y, x]
+            t = 1
+            zt = np.float32(-np.inf)
+            visible = True
+            while visible and zt < 1 and t <= width:
+                zt = z[x] + step * np.float32(t)
+                visible = not ((x - t >= 0 and z[x - t] >= zt) or (x + t < width and z[x + t] >= zt))
+                t += 1
+            if not visible:
+                continue
+            linked = same[left]
+            while linked != left and linked != right:
+                if linked < right:
+                    left = linked
+                    linked = same[left]
+                else:
+                    same[left] = right
+                    left = right
+                    linked = same[left]
+                    right = linked
+            same[left] = right
+        for x in range(width - 1, -1, -1):
+            result[y, x] = pattern_array[y, x] if same[x] == x else result[y, same[x]]
+    return result
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Command-line entry point for Stereogram Sorcery.
+
+Runs the render pipeline without the Tk app, e.g.:
+
+    python -m sorcery render depth.png pattern.png -o stereogram.png --shift 20
+    python -m sorcery decode stereogram.png
+    python -m sorcery ai-batch prompts.jsonl -o generated/ --concurrency 4 --rate 2
+    python -m sorcery serve --port 8765 --workers 4
+    python -m sorcery render-batch manifest.csv -o catalog/ --workers 0
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tracemalloc
+from contextlib import nullcontext
+
+import ai_batch
+import engine
+import export
+import instrument
+import loader
+import stability
+import stego
+import streaming
+
+logger = logging.getLogger("StereogramSorcery")
+
+SIZE_UNITS = {"": 1, "K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30}
+
+
+def parse_size(text):
+    """Byte count from ``512M``, ``2G``, ``64K`` or a plain number of bytes."""
+    value = text.strip().upper().removesuffix("B")
+    unit = value[-1:] if value[-1:] in SIZE_UNITS else ""
+    try:
+        size = int(float(value[:len(value) - len(unit)]) * SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size {text!r}; use e.g. 512M or 2G") from None
+    if size <= 0:
+        raise argparse.ArgumentTypeError("size must be positive")
+    return size
+
+
+def cmd_render(args):
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    with instrument.profiled(args.profile) if args.profile else nullcontext():
+        return _render(args)
+
+
+def _render(args):
+    if args.stream:
+        if len(args.output) > 1:
+            raise ValueError("--stream writes a single output")
+        with instrument.stage("stream_render", strip_rows=args.strip_rows):
+            streaming.render_to_file(
+                args.depth, args.pattern, args.output[0],
+                shift_strength=args.shift,
+                pattern_scale=args.scale,
+                contrast=args.contrast,
+                message=args.message,
+                strip_rows=args.strip_rows,
+                backend=args.backend,
+                mode=args.mode,
+                memory_budget=args.memory_budget,
+            )
+        logger.info(f"Stereogram streamed to {args.output[0]}")
+        return 0
+    depth_array = loader.load_depth(args.depth)
+    pattern_img = engine.load_pattern(args.pattern)
+    result_img = engine.create_stereogram(
+        depth_array, pattern_img,
+        shift_strength=args.shift,
+        pattern_scale=args.scale,
+        contrast=args.contrast,
+        message=args.message,
+        workers=args.workers,
+        backend=args.backend,
+        mode=args.mode,
+        memory_budget=args.memory_budget,
+    )
+    targets = [export.Target(fmt, path, export.encoder_options(fmt, args.compress_level, args.quality))
+               for fmt, path in ((export.format_for_path(path), path) for path in args.output)]
+    results = export.export(result_img, targets, args.message)
+    logger.info(f"Stereogram saved: {export.summary(results)}")
+    return 0
+
+
+def cmd_decode(args):
+    from PIL import Image
+    with Image.open(args.image) as img:
+        message = stego.extract_message(img)
+    print(message)
+    return 1 if message.startswith("[ERR]") else 0
+
+
+def cmd_scan(args):
+    import scanner
+    extensions = tuple(ext.lower() if ext.startswith(".") else f".{ext.lower()}" for ext in args.ext)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            scanner.scan(args.paths, output, args.workers, extensions, args.max_pixels)
+    else:
+        scanner.scan(args.paths, None, args.workers, extensions, args.max_pixels)
+    return 0
+
+
+def cmd_ai_batch(args):
+    api_key = args.api_key or os.environ.get("STABILITY_API_KEY")
+    if not api_key:
+        logger.error("No API key: pass --api-key or set STABILITY_API_KEY")
+        return 2
+    records = ai_batch.generate_batch(
+        args.prompts, args.output, api_key,
+        host=args.host,
+        engine=args.engine,
+        default_type=args.type,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+        use_cache=not args.no_cache,
+        refresh=args.refresh,
+    )
+    failed = sum(1 for record in records if record["status"] != "ok")
+    print(f"{len(records) - failed} generated, {failed} failed")
+    return 1 if failed else 0
+
+
+def cmd_render_batch(args):
+    import batch
+    summary = batch.run(args.manifest, args.output, args.workers or None, args.checkpoint, args.memory_budget)
+    print(f"{summary['rendered']} rendered, {summary['skipped']} already done, {summary['failed']} failed "
+          f"in {summary['wall_s']:.1f} s; summary in {os.path.join(args.output, batch.SUMMARY_FILE)}")
+    return 1 if summary["failed"] else 0
+
+
+def cmd_serve(args):
+    import service
+    service.serve(args.host, args.port, args.workers or None, args.queue, args.timeout, args.max_body,
+                  args.max_pixels)
+    return 0
+
+
+def cmd_backends(args):
+    import backends
+    for mode in backends.MODES:
+        for name in backends.names(available_only=False, mode=mode):
+            state = "available" if name in backends.names(mode=mode) else "not installed"
+            print(f"{mode:<8} {name:<10} {state:<14} {backends.describe(name, mode)}")
+    if args.verify:
+        failures = backends.verify(trials=args.trials, seed=args.seed)
+        for failure in failures:
+            print(f"MISMATCH {failure}")
+        print(f"{len(failures)} mismatches in {args.trials} randomized trials against the reference loops")
+        if failures:
+            return 1
+    if args.time:
+        for mode in backends.MODES:
+            results = backends.timings(mode=mode)
+            for name, seconds in sorted(results.items(), key=lambda item: item[1]):
+                print(f"{mode:<8} {name:<10} {seconds * 1000:8.1f} ms per 1024x1024 render")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="sorcery", description="Headless stereogram rendering")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress and per-stage JSON timings to stderr")
+    parser.add_argument("--trace-memory", action="store_true", help="include peak allocation in the stage timings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="render a stereogram from a depth map and a pattern")
+    render.add_argument("depth", help="depth map image, 8- or 16-bit, or a .npy/.raw array (white is near)")
+    render.add_argument("pattern", help="pattern image to tile")
+    render.add_argument("-o", "--output", required=True, action="append",
+                        help="output image, .png, .jpg or .webp (lossless); repeat to write several formats in one pass")
+    render.add_argument("--shift", type=int, default=engine.DEFAULT_SHIFT_STRENGTH, help="shift strength in pixels")
+    render.add_argument("--scale", type=float, default=engine.DEFAULT_PATTERN_SCALE, help="pattern scale")
+    render.add_argument("--contrast", type=float, default=engine.DEFAULT_CONTRAST, help="depth contrast")
+    render.add_argument("--message", help="secret message to hide in the result")
+    render.add_argument("--workers", type=int, default=1,
+                        help="render row bands on this many processes (0 = one per core)")
+    render.add_argument("--stream", action="store_true",
+                        help="render strip by strip straight to a .png or .npy output, for very large depth maps; "
+                             ".npy, raw, PGM, 8-bit PNG and 16-bit grayscale PNG depth maps are read in strips, "
+                             "other formats are decoded in full")
+    render.add_argument("--strip-rows", type=int, default=streaming.DEFAULT_STRIP_ROWS, help="rows per strip in --stream mode")
+    render.add_argument("--memory-budget", type=parse_size, metavar="SIZE",
+                        help="keep the render's peak memory under this, e.g. 512M; sets the strip height in --stream mode")
+    render.add_argument("--quality", type=int, default=export.DEFAULT_JPEG_QUALITY, help="JPEG quality (1-100)")
+    render.add_argument("--compress-level", type=int, default=export.DEFAULT_COMPRESS_LEVEL, choices=range(10),
+                        metavar="0-9", help="PNG compress level")
+    render.add_argument("--profile", metavar="PATH", help="write a cProfile dump of the render here")
+    render.add_argument("--backend", help="render backend (see the 'backends' command; default numpy)")
+    render.add_argument("--mode", choices=("classic", "linked"),
+                        help="render algorithm: classic copy-left, or linked (symmetric constraint links with "
+                             "hidden-surface removal)")
+    render.set_defaults(func=cmd_render)
+
+    decode = commands.add_parser("decode", help="print the message hidden in a stereogram")
+    decode.add_argument("image")
+    decode.set_defaults(func=cmd_decode)
+
+    scan = commands.add_parser("scan", help="scan image directories for hidden messages (JSONL report)")
+    scan.add_argument("paths", nargs="+", help="directories or files to scan")
+    scan.add_argument("-o", "--output", help="write the JSONL report here instead of stdout")
+    scan.add_argument("--workers", type=int, default=0, help="worker processes (0 = one per core)")
+    scan.add_argument("--ext", nargs="+", default=[".png", ".bmp"], help="file extensions to include")
+    scan.add_argument("--max-pixels", type=int, default=100 * 10 ** 6,
+                      help="largest image decoded, in pixels; checked before decoding")
+    # Scanned archives are untrusted, so scan keeps Pillow's bomb guard
+    scan.set_defaults(func=cmd_scan, untrusted_input=True)
+
+    check = commands.add_parser("backends", help="list render backends, check them against the reference, time them")
+    check.add_argument("--verify", action="store_true", help="compare every backend with the reference loop")
+    check.add_argument("--trials", type=int, default=50, help="randomized inputs for --verify")
+    check.add_argument("--seed", type=int, default=0, help="random seed for --verify")
+    check.add_argument("--time", action="store_true", help="time each backend on a 1024x1024 render")
+    check.set_defaults(func=cmd_backends)
+
+    batch = commands.add_parser("ai-batch", help="generate many AI depth maps/patterns concurrently (resumable)")
+    batch.add_argument("prompts", help="JSONL of {prompt, type, id, seed} objects, or one prompt per line")
+    batch.add_argument("-o", "--output", required=True, help="directory for the images and results.jsonl")
+    batch.add_argument("--type", choices=stability.GEN_TYPES, default="depthMap",
+                       help="generation type for prompts that do not name one")
+    batch.add_argument("--concurrency", type=int, default=ai_batch.DEFAULT_CONCURRENCY, help="requests in flight")
+    batch.add_argument("--rate", type=float, default=ai_batch.DEFAULT_RATE, help="requests started per second")
+    batch.add_argument("--burst", type=int, default=ai_batch.DEFAULT_BURST, help="requests allowed in a burst")
+    batch.add_argument("--api-key", help="Stability API key (default: $STABILITY_API_KEY)")
+    batch.add_argument("--host", default=stability.DEFAULT_HOST, help="API host, e.g. a local fake server")
+    batch.add_argument("--engine", default=stability.DEFAULT_ENGINE, help="generation engine")
+    batch.add_argument("--no-cache", action="store_true", help="do not read or write the AI image cache")
+    batch.add_argument("--refresh", action="store_true", help="regenerate even when a cached image exists")
+    batch.set_defaults(func=cmd_ai_batch)
+
+    render_batch = commands.add_parser("render-batch", help="render every row of a CSV/JSON manifest (resumable)")
+    render_batch.add_argument("manifest", help="CSV, JSON or JSONL with depth, pattern and optional render settings")
+    render_batch.add_argument("-o", "--output", required=True, help="directory for the stereograms and summary.json")
+    render_batch.add_argument("--workers", type=int, default=0, help="worker processes (0 = one per core)")
+    render_batch.add_argument("--checkpoint", help="checkpoint file (default: checkpoint.jsonl in the output directory)")
+    render_batch.add_argument("--memory-budget", type=parse_size, metavar="SIZE",
+                              help="keep each job's render under this peak memory, e.g. 512M")
+    render_batch.set_defaults(func=cmd_render_batch)
+
+    serve = commands.add_parser("serve", help="run a local HTTP render service (POST /render, GET /metrics)")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on")
+    serve.add_argument("--workers", type=int, default=0, help="render processes (0 = one per core)")
+    serve.add_argument("--queue", type=int, help="renders allowed to wait before requests get 503 (default 2 per worker)")
+    serve.add_argument("--timeout", type=float, default=300.0, help="seconds a request waits for its render")
+    serve.add_argument("--max-body", type=parse_size, default=256 * 2 ** 20, metavar="SIZE",
+                       help="largest request body accepted, e.g. 64M")
+    serve.add_argument("--max-pixels", type=int, default=100 * 10 ** 6,
+                       help="largest depth map or pattern accepted, in pixels; checked before decoding")
+    serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.trace_memory:
+        tracemalloc.start()
+    # Local print-size files trip Pillow's bomb guard; the render service's workers keep it
+    if not getattr(args, "untrusted_input", False):
+        loader.allow_large_images()
+    try:
+        return args.func(args)
+    except Exception as e:
+        logger.error(f"{args.command} failed: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Stability AI text-to-image client.
+
+A reusable client around one ``requests.Session``, so repeated generations
+reuse pooled keep-alive connections. Rate limits and transient server errors
+are retried with exponential backoff that honours ``Retry-After``, and the
+base64 artifact is decoded while the response streams in rather than after
+the whole JSON body has been parsed. Point ``host`` at a local stub server to
+exercise it offline.
+"""
+
+import binascii
+import email.utils
+import logging
+import random
+import time
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+
+logger = logging.getLogger("StereogramSorcery")
+
+DEFAULT_HOST = "https://api.stability.ai"
+DEFAULT_ENGINE = "stable-diffusion-v1-6"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_SIZE = 512
+DEFAULT_CFG_SCALE = 7
+DEFAULT_STEPS = 30
+GEN_TYPES = ("depthMap", "pattern")
+
+
+class StabilityError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def enhance_prompt(prompt, gen_type):
+    """Wrap a user prompt in the instructions for a depth map or a seamless pattern."""
+    if gen_type == "depthMap":
+        return f"Depth map for {prompt}. Clear grayscale image with strong contrast."
+    return f"{prompt}. Create a seamless repeating pattern with subtle details."
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def decode_base64_field(chunks, field="base64"):
+    """Decode the first ``"<field>": "..."`` string value of a streamed JSON body.
+
+    Decoding happens chunk by chunk, so the encoded artifact is never held as
+    one big string next to the parsed JSON.
+    """
+    marker = f'"{field}"'.encode()
+    buf = b""
+    pending = b""
+    out = BytesIO()
+    in_value = False
+    for chunk in chunks:
+        buf += chunk
+        if not in_value:
+            start = buf.find(marker)
+            if start < 0:
+                buf = buf[-len(marker):]
+                continue
+            quote = buf.find(b'"', start + len(marker))
+            if quote < 0:
+                buf = buf[start:]
+                continue
+            buf = buf[quote + 1:]
+            in_value = True
+        end = buf.find(b'"')
+        # JSON encoders may escape "/" as "\/"; base64 never contains a backslash
+        data = pending + (buf if end < 0 else buf[:end]).replace(b"\\", b"")
+        usable = len(data) if end >= 0 else len(data) - len(data) % 4
+        out.write(binascii.a2b_base64(data[:usable]))
+        pending = data[usable:]
+        if end >= 0:
+            return out.getvalue()
+        buf = b""
+    raise StabilityError("No image data found in API response")
+
+
+class StabilityClient:
+    def __init__(self, api_key, host=DEFAULT_HOST, engine=DEFAULT_ENGINE, connect_timeout=10.0,
+                 read_timeout=60.0, max_retries=4, backoff=1.0, max_backoff=30.0, pool_size=4,
+                 chunk_size=64 * 1024):
+        self.api_key = api_key
+        self.host = host.rstrip("/")
+        self.engine = engine
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        })
+
+    def retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def text_to_image(self, prompt, width=DEFAULT_SIZE, height=DEFAULT_SIZE, cfg_scale=DEFAULT_CFG_SCALE,
+                      steps=DEFAULT_STEPS, seed=None, on_retry=None):
+        """Generate one image for ``prompt`` and return it as a PIL image.
+
+        ``on_retry(attempt, delay, reason)`` is called before each retry wait.
+        """
+        url = f"{self.host}/v1/generation/{self.engine}/text-to-image"
+        payload = {
+            "text_prompts": [{"text": prompt, "weight": 1.0}],
+            "cfg_scale": cfg_scale,
+            "height": height,
+            "width": width,
+            "samples": 1,
+            "steps": steps,
+        }
+        if seed is not None:
+            payload["seed"] = seed
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=True)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    raise StabilityError(f"API unreachable: {e}")
+                self._wait(attempt, None, f"connection error ({e.__class__.__name__})", on_retry)
+                continue
+            with response:
+                if response.status_code == 200:
+                    image_data = decode_base64_field(response.iter_content(self.chunk_size))
+                    image = Image.open(BytesIO(image_data))
+                    image.load()
+                    return image
+                if response.status_code in RETRY_STATUSES and not last_attempt:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    self._wait(attempt, retry_after, f"HTTP {response.status_code}", on_retry)
+                    continue
+                raise self._error(response)
+
+    def _wait(self, attempt, retry_after, reason, on_retry):
+        delay = self.retry_delay(attempt, retry_after)
+        logger.warning(f"Stability API {reason}; retrying in {delay:.1f}s")
+        if on_retry is not None:
+            on_retry(attempt + 1, delay, reason)
+        time.sleep(delay)
+
+    @staticmethod
+    def _error(response):
+        error_message = f"API error: {response.status_code}"
+        try:
+            error_json = response.json()
+            if "message" in error_json:
+                error_message += f" - {error_json['message']}"
+        except ValueError:
+            pass
+        logger.error(f"API error details: {response.text}")
+        return StabilityError(error_message, response.status_code)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,111 @@
+"""
+LSB steganography for stereograms.
+
+Messages are stored in the least significant bit of each RGB channel, in
+row-major pixel order, behind a 4-byte big-endian length header.
+"""
+
+import numpy as np
+from PIL import Image
+
+
+HEADER_BYTES = 4
+
+
+def payload_bits(message):
+    """Bits of the length-prefixed UTF-8 payload, most significant bit first."""
+    message_bytes = message.encode('utf-8')
+    message_data = len(message_bytes).to_bytes(HEADER_BYTES, byteorder='big') + message_bytes
+    return np.unpackbits(np.frombuffer(message_data, dtype=np.uint8))
+
+
+def capacity_bytes(shape):
+    height, width = shape[:2]
+    return (height * width * 3) // 8
+
+
+def write_bits(flat, bits, start=0):
+    """Write the payload bits that land in ``flat`` into its LSBs, in place.
+
+    ``flat`` is a run of channel values whose first element holds payload bit
+    ``start``, which lets strip renderers embed piece by piece.
+    """
+    chunk = bits[start:start + flat.size]
+    target = flat[:chunk.size]
+    np.bitwise_and(target, 0xFE, out=target)
+    np.bitwise_or(target, chunk, out=target)
+    return chunk.size
+
+
+def embed_message_array(img_array, message):
+    """Hide ``message`` in a C-contiguous (height, width, 3) uint8 array, in place."""
+    if img_array.dtype != np.uint8 or img_array.ndim != 3 or img_array.shape[2] != 3:
+        raise ValueError(f"Expected an RGB uint8 array, got {img_array.dtype} with shape {img_array.shape}")
+    if not img_array.flags.c_contiguous:
+        raise ValueError("Image array must be C-contiguous to embed in place")
+    bits = payload_bits(message)
+    max_bytes = capacity_bytes(img_array.shape)
+    if bits.size // 8 > max_bytes:
+        raise ValueError(f"Message too large: {bits.size // 8} bytes exceeds maximum of {max_bytes} bytes")
+    write_bits(img_array.reshape(-1), bits)
+    return img_array
+
+
+def embed_message(image, message):
+    """Return a copy of ``image`` with ``message`` hidden in its pixel LSBs."""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    img_array = np.array(image)
+    embed_message_array(img_array, message)
+    return Image.fromarray(img_array)
+
+
+HEADER_BITS = HEADER_BYTES * 8
+
+
+def read_payload(read_bits, capacity_bits):
+    """Return the raw payload bytes, reading only as many LSBs as needed.
+
+    ``read_bits(n)`` must return the first ``n`` LSBs of the image in embedding
+    order. The header is read first, and a length that cannot fit in
+    ``capacity_bits`` is rejected before any payload bits are touched.
+    """
+    if capacity_bits < HEADER_BITS:
+        raise ValueError("No hidden message found")
+    length = int.from_bytes(np.packbits(read_bits(HEADER_BITS)).tobytes(), byteorder='big')
+    total_bits = HEADER_BITS + length * 8
+    if total_bits > capacity_bits:
+        raise ValueError("No hidden message found")
+    return np.packbits(read_bits(total_bits)[HEADER_BITS:]).tobytes()
+
+
+def lsb_prefix(image, nbits):
+    """First ``nbits`` LSBs of ``image``, converting only the rows that hold them."""
+    width, height = image.size
+    rows = min(-(-nbits // (width * 3)), height)
+    region = image.crop((0, 0, width, rows))
+    if region.mode != "RGB":
+        region = region.convert("RGB")
+    return np.asarray(region).reshape(-1)[:nbits] & 1
+
+
+def decode_payload(read_bits, capacity_bits):
+    try:
+        message_bytes = read_payload(read_bits, capacity_bits)
+    except ValueError as e:
+        return f"[ERR] {e}"
+    try:
+        return message_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return "[ERR] Invalid UTF-8 data"
+
+
+def extract_message(image):
+    """Return the hidden message, or a string starting with ``[ERR]`` when there is none."""
+    width, height = image.size
+    return decode_payload(lambda n: lsb_prefix(image, n), width * height * 3)
+
+
+def extract_message_array(img_array):
+    flat = img_array.reshape(-1)
+    return decode_payload(lambda n: flat[:n] & 1, flat.size)
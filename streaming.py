@@ -0,0 +1,273 @@
+"""
+Out-of-core strip rendering for very large depth maps.
+
+The depth map is read in horizontal strips, each strip is rendered on its own
+and written straight to the output file, so peak memory follows the strip
+height instead of the image size. Depth maps stored as ``.npy``, raw or binary
+PGM are memory-mapped. Non-interlaced 8-bit PNGs and 16-bit grayscale PNGs are
+inflated strip by strip. Other formats (TIFF, JPEG, BMP, other PNGs) are
+decoded once to an 8- or 16-bit grayscale array, the only full-size buffer in
+that case. Output is streamed as PNG or into a memory-mapped ``.npy`` file.
+"""
+
+import logging
+import os
+import struct
+import zlib
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import backends
+import engine
+import loader
+import stego
+
+logger = logging.getLogger("StereogramSorcery")
+
+DEFAULT_STRIP_ROWS = 256
+# Per-pixel strip buffers besides the kernel's: contrast-adjusted depth, pattern slice, PNG filter and bytes copy
+STRIP_BYTES_PER_PIXEL = 1 + 3 + 3 + 3
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+class PNGRows:
+    """Read a non-interlaced PNG's rows in order, inflating only as much as each strip needs.
+
+    Each strip's filtered rows are wrapped in a small uncompressed PNG behind
+    the previous row, unfiltered, so Pillow undoes the filters in C. Rows must
+    survive a round trip through the decoded image, which limits this to
+    8-bit PNGs and 16-bit grayscale ones. ``convert`` turns each decoded strip
+    into the array ``read`` returns; by default its grayscale depth.
+    """
+
+    def __init__(self, path, convert=loader.depth_from_image):
+        self.convert = convert
+        self.file = open(path, "rb")
+        try:
+            if self.file.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                raise ValueError(f"{os.path.basename(path)} is not a PNG file")
+            kind, self._ihdr = next(self._chunks())
+            if kind != b"IHDR":
+                raise ValueError(f"{os.path.basename(path)} has no PNG header")
+            self.width, self.height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", self._ihdr)
+            channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color_type, 0)
+            self.streamable = bool(channels) and not interlace and (
+                bit_depth == 8 or (bit_depth == 16 and color_type == 0))
+            self.stride = self.width * channels * bit_depth // 8
+            self.sixteen_bit = bit_depth == 16
+            # Palette and transparency chunks change how Pillow decodes the rows
+            self._extra = b""
+            for kind, data in self._chunks():
+                if kind == b"IDAT":
+                    self._first = data
+                    break
+                if kind in (b"PLTE", b"tRNS"):
+                    self._extra += _chunk(kind, data)
+        except Exception:
+            self.file.close()
+            raise
+        self._inflate = zlib.decompressobj()
+        self._buffer = bytearray()
+        self._compressed = self._idat()
+        self._previous = None
+        self.row = 0
+
+    def _chunks(self):
+        while True:
+            head = self.file.read(8)
+            if len(head) < 8:
+                raise ValueError(f"{os.path.basename(self.file.name)} is truncated")
+            length, kind = struct.unpack(">I4s", head)
+            data = self.file.read(length)
+            self.file.seek(4, os.SEEK_CUR)
+            yield kind, data
+
+    def _idat(self):
+        yield self._first
+        for kind, data in self._chunks():
+            if kind == b"IDAT":
+                yield data
+            elif kind == b"IEND":
+                return
+
+    def read(self, y0, y1):
+        if y0 != self.row:
+            raise ValueError(f"PNG rows must be read in order: expected row {self.row}, got {y0}")
+        need = (y1 - y0) * (self.stride + 1)
+        while len(self._buffer) < need:
+            data = self._inflate.unconsumed_tail or next(self._compressed, None)
+            if data is None:
+                raise ValueError(f"{os.path.basename(self.file.name)} has fewer rows than its header declares")
+            # A cap on the output keeps one highly compressed chunk from inflating past the strip
+            self._buffer += self._inflate.decompress(data, need - len(self._buffer))
+        filtered = bytes(self._buffer[:need])
+        del self._buffer[:need]
+        rows = y1 - y0
+        if self._previous is not None:
+            filtered = b"\0" + self._previous + filtered
+            rows += 1
+        header = struct.pack(">II", self.width, rows) + self._ihdr[8:]
+        png = (PNG_SIGNATURE + _chunk(b"IHDR", header) + self._extra
+               + _chunk(b"IDAT", zlib.compress(filtered, 0)) + _chunk(b"IEND", b""))
+        with Image.open(BytesIO(png)) as img:
+            raw = np.asarray(img)
+            pixels = self.convert(img)
+        last = raw[-1].astype(">u2") if self.sixteen_bit else raw[-1]
+        self._previous = last.tobytes()
+        self.row = y1
+        return pixels[rows - (y1 - y0):]
+
+    def close(self):
+        self.file.close()
+
+
+class DepthStrips:
+    """Row-strip access to a depth map without decoding it all when avoidable."""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = None
+        self.array = loader.map_depth(path)
+        if self.array is None and os.path.splitext(path)[1].lower() == ".png":
+            rows = PNGRows(path)
+            if rows.streamable:
+                self.rows = rows
+                self.height, self.width = rows.height, rows.width
+                return
+            rows.close()
+        if self.array is None:
+            logger.info(f"{os.path.basename(path)} cannot be read in strips; decoding it once")
+            self.array = loader.decode_depth(path)
+        loader.check_depth(self.array)
+        self.height, self.width = self.array.shape
+
+    @property
+    def resident_bytes(self):
+        """Bytes held for the whole render: a decoded depth map, or nothing when read in strips."""
+        if self.array is None or isinstance(self.array, np.memmap):
+            return 0
+        return self.array.nbytes
+
+    @property
+    def bytes_per_pixel(self):
+        """Per-pixel strip buffers of reading a strip: PNG rows are inflated, copied, decoded and converted."""
+        return 0 if self.rows is None else 4 * -(-self.rows.stride // self.width) + 2
+
+    def read(self, y0, y1):
+        if self.rows is not None:
+            return self.rows.read(y0, y1)
+        return np.asarray(self.array[y0:y1])
+
+    def close(self):
+        if self.rows is not None:
+            self.rows.close()
+
+
+class PNGStripWriter:
+    """Write an RGB PNG row strip by row strip with a streaming zlib compressor."""
+
+    def __init__(self, path, width, height, compress_level=6):
+        self.file = open(path, "wb")
+        self.width = width
+        self.compressor = zlib.compressobj(compress_level)
+        self.file.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(_chunk(kind, data))
+
+    def write(self, rows):
+        # PNG "Sub" filter: each byte minus the same channel of the previous pixel
+        rows = rows.reshape(rows.shape[0], self.width * 3)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:4] = rows[:, :3]
+        np.subtract(rows[:, 3:], rows[:, :-3], out=filtered[:, 4:])
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+
+
+class NpyStripWriter:
+    """Write strips into a memory-mapped ``.npy`` array of shape (height, width, 3)."""
+
+    def __init__(self, path, width, height):
+        self.array = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+        self.row = 0
+
+    def write(self, rows):
+        self.array[self.row:self.row + rows.shape[0]] = rows
+        self.row += rows.shape[0]
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+
+def open_writer(path, width, height, compress_level=6):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".png":
+        return PNGStripWriter(path, width, height, compress_level)
+    if ext == ".npy":
+        return NpyStripWriter(path, width, height)
+    raise ValueError(f"Streaming output must be .png or .npy, not {ext or 'no extension'}")
+
+
+def render_to_file(depth_path, pattern, output_path, shift_strength=engine.DEFAULT_SHIFT_STRENGTH,
+                   pattern_scale=engine.DEFAULT_PATTERN_SCALE, contrast=engine.DEFAULT_CONTRAST,
+                   message=None, strip_rows=DEFAULT_STRIP_ROWS, compress_level=6, backend=None, mode=None,
+                   memory_budget=None):
+    """Render ``depth_path`` strip by strip into ``output_path``.
+
+    ``pattern`` is a PIL image or a path. Only the scaled pattern tile is kept
+    in memory; each strip's slice of the tiling is built by modulo indexing.
+    A hidden ``message`` is written into whichever strips its bits land in.
+    ``backend`` and ``mode`` name the render kernel from ``backends.py``.
+    With ``memory_budget`` (bytes), ``strip_rows`` is replaced by the tallest
+    strip that fits the budget next to the pattern tile and any decoded depth map.
+    """
+    engine.check_shift_strength(shift_strength)
+    render = backends.get(backend, mode)
+    if not isinstance(pattern, Image.Image):
+        pattern = engine.load_pattern(pattern)
+    depth = DepthStrips(depth_path)
+    width, height = depth.width, depth.height
+    tile = engine.scale_pattern(pattern, pattern_scale)
+    tile_cols = np.arange(width) % tile.shape[1]
+    if memory_budget:
+        fixed = tile.nbytes + tile_cols.nbytes
+        fixed += depth.resident_bytes
+        row_bytes = STRIP_BYTES_PER_PIXEL + depth.bytes_per_pixel + backends.bytes_per_pixel(backend, mode)
+        strip_rows = min(engine.budget_rows(memory_budget, width, row_bytes, fixed), height)
+        logger.info(f"Streaming {strip_rows} rows per strip within {memory_budget / 2 ** 20:.0f} MB")
+    bits = stego.payload_bits(message) if message else None
+    if bits is not None and bits.size // 8 > stego.capacity_bytes((height, width)):
+        raise ValueError(f"Message too large: {bits.size // 8} bytes exceeds maximum of "
+                         f"{stego.capacity_bytes((height, width))} bytes")
+    writer = open_writer(output_path, width, height, compress_level)
+    try:
+        for y0 in range(0, height, strip_rows):
+            y1 = min(y0 + strip_rows, height)
+            depth_enhanced = engine.adjust_contrast(depth.read(y0, y1), contrast)
+            pattern_strip = tile[np.arange(y0, y1) % tile.shape[0]][:, tile_cols]
+            strip = render(depth_enhanced, pattern_strip, shift_strength)
+            start = y0 * width * 3
+            if bits is not None and start < bits.size:
+                stego.write_bits(strip.reshape(-1), bits, start)
+            writer.write(strip)
+            logger.debug(f"Rendered rows {y0}-{y1} of {height}")
+    finally:
+        writer.close()
+        depth.close()
+    return width, height
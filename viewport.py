@@ -0,0 +1,172 @@
+"""
+Display helpers for large images.
+
+``ImagePyramid`` keeps successively halved copies of an image, built on
+demand, so fitting an 8K result into a canvas resizes a copy only a little
+larger than the canvas instead of the full source. ``Viewport`` holds the zoom
+and pan of one canvas and cuts out just the visible part of the right pyramid
+level, so the cost of a redraw depends on the canvas size rather than the
+image size. Neither class touches Tk.
+"""
+
+from collections import OrderedDict
+
+from PIL import Image
+
+MIN_LEVEL_SIZE = 256
+FIT_CACHE_SIZE = 4
+MAX_ZOOM = 16.0
+
+# Modes Image.reduce and LANCZOS resizing work on directly
+_DISPLAY_MODES = ("L", "RGB", "RGBA", "I", "F")
+
+
+class ImagePyramid:
+    def __init__(self, img, min_size=MIN_LEVEL_SIZE):
+        self.source = img
+        if img.mode not in _DISPLAY_MODES:
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        self.levels = [img]
+        self.min_size = min_size
+        self._fits = OrderedDict()
+
+    @property
+    def size(self):
+        return self.levels[0].size
+
+    def level(self, index):
+        """Level ``index`` (half the size of level ``index - 1``), or the smallest level built."""
+        while len(self.levels) <= index:
+            last = self.levels[-1]
+            if max(last.size) <= self.min_size:
+                break
+            self.levels.append(last.reduce(2))
+        return self.levels[min(index, len(self.levels) - 1)]
+
+    def level_for(self, scale):
+        """The smallest level at least ``scale`` times the source size, with its actual scale."""
+        index = 0
+        while 0.5 ** (index + 1) >= scale:
+            index += 1
+        level = self.level(index)
+        return level, level.width / self.size[0]
+
+    def fit(self, width, height):
+        """The whole image scaled to fit ``width`` x ``height``, never upscaled."""
+        source_width, source_height = self.size
+        scale = min(width / max(source_width, 1), height / max(source_height, 1), 1.0)
+        target = (max(int(source_width * scale), 1), max(int(source_height * scale), 1))
+        fitted = self._fits.get(target)
+        if fitted is None:
+            level, _ = self.level_for(scale)
+            fitted = level if level.size == target else level.resize(target, Image.LANCZOS)
+            self._fits[target] = fitted
+            while len(self._fits) > FIT_CACHE_SIZE:
+                self._fits.popitem(last=False)
+        else:
+            self._fits.move_to_end(target)
+        return fitted
+
+
+class Viewport:
+    """Zoom and pan of an image on a canvas.
+
+    ``zoom`` is display pixels per image pixel, or None to fit the canvas;
+    ``center`` is the image point shown at the middle of the canvas.
+    """
+
+    def __init__(self):
+        self.image_size = (1, 1)
+        self.canvas_size = (1, 1)
+        self.zoom = None
+        self.center = (0.5, 0.5)
+
+    def set_image(self, size):
+        # A new image of the same size keeps the view, so re-renders can be compared in place
+        if size != self.image_size:
+            self.image_size = size
+            self.reset()
+
+    def set_canvas(self, size):
+        self.canvas_size = (max(size[0], 1), max(size[1], 1))
+        self._clamp()
+
+    def reset(self):
+        self.zoom = None
+        self.center = (self.image_size[0] / 2, self.image_size[1] / 2)
+
+    def fit_scale(self):
+        return min(self.canvas_size[0] / self.image_size[0], self.canvas_size[1] / self.image_size[1], 1.0)
+
+    @property
+    def scale(self):
+        return self.fit_scale() if self.zoom is None else self.zoom
+
+    def canvas_to_image(self, x, y):
+        scale = self.scale
+        return (self.center[0] + (x - self.canvas_size[0] / 2) / scale,
+                self.center[1] + (y - self.canvas_size[1] / 2) / scale)
+
+    def zoom_at(self, factor, x, y):
+        """Zoom by ``factor`` keeping the image point under canvas position (x, y) in place."""
+        image_x, image_y = self.canvas_to_image(x, y)
+        zoom = min(self.scale * factor, MAX_ZOOM)
+        if zoom <= self.fit_scale():
+            self.reset()
+            return
+        self.zoom = zoom
+        self.center = (image_x - (x - self.canvas_size[0] / 2) / zoom,
+                       image_y - (y - self.canvas_size[1] / 2) / zoom)
+        self._clamp()
+
+    def actual_size(self, x, y):
+        """Show the image at 1:1 around canvas position (x, y)."""
+        self.zoom_at(1.0 / self.scale, x, y)
+
+    def pan(self, dx, dy):
+        """Move the image by (dx, dy) canvas pixels."""
+        scale = self.scale
+        self.center = (self.center[0] - dx / scale, self.center[1] - dy / scale)
+        self._clamp()
+
+    def _clamp(self):
+        scale = self.scale
+        center = []
+        for axis in (0, 1):
+            half = self.canvas_size[axis] / 2 / scale
+            extent = self.image_size[axis]
+            # Centre images smaller than the canvas; otherwise keep the canvas covered
+            center.append(extent / 2 if 2 * half >= extent else min(max(self.center[axis], half), extent - half))
+        self.center = tuple(center)
+
+    def view(self):
+        """Visible image box ``(left, top, right, bottom)``, its display size, and its canvas offset."""
+        scale = self.scale
+        box = []
+        for axis in (0, 1):
+            half = self.canvas_size[axis] / 2 / scale
+            low = max(int(self.center[axis] - half), 0)
+            high = min(int(self.center[axis] + half) + 1, self.image_size[axis])
+            box.append((low, max(high, low + 1)))
+        (left, right), (top, bottom) = box
+        size = (max(round((right - left) * scale), 1), max(round((bottom - top) * scale), 1))
+        offset = (round(self.canvas_size[0] / 2 + (left - self.center[0]) * scale),
+                  round(self.canvas_size[1] / 2 + (top - self.center[1]) * scale))
+        return (left, top, right, bottom), size, offset
+
+    def render(self, pyramid):
+        """Return ``(tile, (x, y))``: the visible part of the image at display size and where to draw it."""
+        if self.zoom is None:
+            fitted = pyramid.fit(*self.canvas_size)
+            return fitted, ((self.canvas_size[0] - fitted.width) // 2, (self.canvas_size[1] - fitted.height) // 2)
+        (left, top, right, bottom), size, offset = self.view()
+        scale = self.scale
+        if scale >= 1:
+            tile = pyramid.levels[0].crop((left, top, right, bottom))
+            return (tile if tile.size == size else tile.resize(size, Image.NEAREST)), offset
+        level, level_scale = pyramid.level_for(scale)
+        box = (int(left * level_scale), int(top * level_scale),
+               max(int(right * level_scale + 0.999), int(left * level_scale) + 1),
+               max(int(bottom * level_scale + 0.999), int(top * level_scale) + 1))
+        tile = level.crop(box)
+        return (tile if tile.size == size else tile.resize(size, Image.BILINEAR)), offset